@@ -0,0 +1,270 @@
+"""
+Solves a batch of single player puzzles in parallel.
+
+Run from the nanang-1.0 directory:
+
+    python -m agent.batch puzzles/ more.jsonl -j 8 -t 10 -s 200 -o out.jsonl
+
+Every argument is a JSON puzzle file, a directory of them, or a JSON lines
+file with one puzzle per line. The puzzles are spread over a pool of worker
+processes, each puzzle with its own CPU time and memory limit, and one JSON
+line is written per puzzle as soon as it is done (so in completion order,
+not input order), with fields:
+
+    id, colour, status ("solved", "unsolvable", "timeout", "memory" or
+    "error"), moves, length, expanded, time
+
+With --cache FILE, solutions are also kept in a SolutionCache (see
+agent.solution_cache) saved in FILE between runs. A puzzle that is in the
+cache, or a rotation or mirror image of one that is, is answered at once
+without a search (with "cached": true), and a puzzle repeated within a batch
+is only searched for once.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import signal
+import resource
+import argparse
+import threading
+import multiprocessing
+
+from game.board import Board
+from game.move import Move
+from agent.player import Player
+from agent.solution_cache import SolutionCache
+
+# the Player method each --method runs.
+METHODS = {
+    "astar": "find_path",
+    "ida": "find_path_ida",
+    "bidirectional": "find_path_bidirectional",
+}
+
+class _OutOfTime(Exception):
+    """Raised inside a worker when a puzzle uses up its CPU time."""
+
+def _on_timer(signum, frame):
+    raise _OutOfTime()
+
+def read_puzzles(paths):
+    """
+    Lazily reads (id, puzzle) pairs out of the given files and directories.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(x for x in os.listdir(path) if x.endswith(".json"))
+            yield from read_puzzles(os.path.join(path, x) for x in names)
+        elif path.endswith(".jsonl"):
+            with open(path) as f:
+                for lineno, line in enumerate(f, 1):
+                    if line.strip():
+                        yield f"{path}:{lineno}", json.loads(line)
+        else:
+            with open(path) as f:
+                yield path, json.load(f)
+
+def _init_worker(space_limit):
+    # limits are per process, so set them up once in every worker.
+    signal.signal(signal.SIGVTALRM, _on_timer)
+    if space_limit:
+        limit = int(space_limit * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def solve(task):
+    """
+    Solves a single puzzle inside a worker, turning running out of time or
+    memory into a status rather than an error.
+    """
+    ident, puzzle, method, use_pdb, time_limit = task
+    result = {"id": ident, "colour": puzzle.get("colour"), "moves": None,
+        "length": None, "expanded": 0}
+    player = None
+    start = time.time()
+    try:
+        if time_limit:
+            # counts CPU time spent by this worker only.
+            signal.setitimer(signal.ITIMER_VIRTUAL, time_limit)
+        board = Board(Board.from_json(puzzle))
+        player = Player(board, puzzle["colour"][0].upper(), use_pdb=use_pdb)
+        moves = getattr(player, METHODS[method])()
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        if moves is None:
+            result["status"] = "unsolvable"
+        else:
+            result["status"] = "solved"
+            result["moves"] = [str(move) for move in moves]
+            result["length"] = len(moves)
+            # (for the cache, which is kept by the main process)
+            result["codes"] = [move.encode() for move in moves]
+    except _OutOfTime:
+        result["status"] = "timeout"
+    except MemoryError:
+        result["status"] = "memory"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = repr(e)
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+
+    if player is not None:
+        result["expanded"] = player.expanded
+    result["time"] = round(time.time() - start, 6)
+    # hand the memory back before the next puzzle is measured against it.
+    del player
+    gc.collect()
+    return result
+
+def _parts(puzzle):
+    # the colour, pieces and blocks of a puzzle, as a SolutionCache takes them.
+    colour = puzzle["colour"][0].upper()
+    contents = Board.from_json(puzzle)
+    pieces = [x for x, c in contents.items() if c == colour]
+    blocks = [x for x, c in contents.items() if c == "X"]
+    return colour, pieces, blocks
+
+def _cached(ident, puzzle, moves, start):
+    # the result for a puzzle answered from the cache.
+    return {"id": ident, "colour": puzzle.get("colour"),
+        "moves": [str(move) for move in moves], "length": len(moves),
+        "expanded": 0, "status": "solved", "cached": True,
+        "time": round(time.time() - start, 6)}
+
+def _repeated(result, ident, puzzle, start):
+    # the result for a repeat of a puzzle that couldn't be solved, which has
+    # the same outcome.
+    return dict(result, id=ident, colour=puzzle.get("colour"), expanded=0,
+        cached=True, time=round(time.time() - start, 6))
+
+def _known(task):
+    # results already known (from the cache) go through the pool as tasks
+    # too, so that it can be fed from a single stream as the input is read.
+    if isinstance(task, dict):
+        return task
+    return solve(task)
+
+def solve_cached(pool, cache, puzzles, method, use_pdb, time_limit):
+    """
+    Solves puzzles on a pool of workers, answering the ones the cache has
+    (in some orientation) without searching and sending every other puzzle
+    to the workers once, however many times it is repeated. Solutions found
+    are added to the cache. Puzzles are read as the pool hands them out, as
+    they are without a cache.
+
+    :return: generator of the results, as solve gives them
+    """
+    # the pool reads the tasks in a thread of its own, so everything here
+    # that the tasks and the results both use is only touched under the lock.
+    lock = threading.Lock()
+    # the cache key and parts of every puzzle being searched (by id), the
+    # repeats waiting for one (by key) as (id, puzzle, parts), and the result
+    # of every key whose search didn't find a solution.
+    searching = {}
+    waiting = {}
+    failed = {}
+
+    def tasks():
+        for ident, puzzle in puzzles:
+            start = time.time()
+            try:
+                parts = _parts(puzzle)
+                key = SolutionCache.key(*parts)
+            except Exception:
+                # let a worker report what is wrong with the puzzle.
+                yield (ident, puzzle, method, use_pdb, time_limit)
+                continue
+            with lock:
+                moves = cache.get(*parts)
+                known = failed.get(key)
+                if moves is None and known is None:
+                    if key in waiting:
+                        waiting[key].append((ident, puzzle, parts))
+                        continue
+                    searching[ident] = (key, parts)
+                    waiting[key] = []
+            if moves is not None:
+                yield _cached(ident, puzzle, moves, start)
+            elif known is not None:
+                yield _repeated(known, ident, puzzle, start)
+            else:
+                yield (ident, puzzle, method, use_pdb, time_limit)
+
+    for result in pool.imap_unordered(_known, tasks()):
+        codes = result.pop("codes", None)
+        result.setdefault("cached", False)
+        yield result
+        with lock:
+            if result["id"] not in searching:
+                continue
+            key, (colour, pieces, blocks) = searching.pop(result["id"])
+            if codes is not None:
+                cache.put(colour, pieces, blocks,
+                    [Move.decode(colour, code) for code in codes])
+            else:
+                failed[key] = result
+            repeats = waiting.pop(key)
+            found = [cache.get(*parts) if codes is not None else None
+                for _, _, parts in repeats]
+        for (ident, puzzle, _), moves in zip(repeats, found):
+            if moves is not None:
+                yield _cached(ident, puzzle, moves, time.time())
+            else:
+                yield _repeated(result, ident, puzzle, time.time())
+
+def get_options():
+    """Parse and return command-line arguments."""
+    parser = argparse.ArgumentParser(prog="agent.batch",
+        description="solves single player Chexers puzzles in parallel.")
+    parser.add_argument("paths", nargs="+", metavar="path",
+        help="puzzle file (.json), puzzle directory or JSON lines file")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("-m", "--method", choices=sorted(METHODS),
+        default="astar", help="search to run (default: astar)")
+    parser.add_argument("-p", "--pdb", action="store_true",
+        help="use the pattern database heuristic")
+    parser.add_argument("-t", "--time", type=float, default=0,
+        help="limit on CPU time (float, seconds) per puzzle, 0 for none")
+    parser.add_argument("-s", "--space", type=float, default=0,
+        help="limit on memory (float, MB) per worker, 0 for none")
+    parser.add_argument("-o", "--output", default=None,
+        help="file to write results to (default: standard output)")
+    parser.add_argument("-c", "--cache", metavar="FILE", default=None,
+        help="solution cache file to answer repeated puzzles from, and to "
+            "add new solutions to")
+    return parser.parse_args()
+
+def main():
+    options = get_options()
+    tasks = ((ident, puzzle, options.method, options.pdb, options.time)
+        for ident, puzzle in read_puzzles(options.paths))
+
+    out = sys.stdout
+    if options.output is not None:
+        out = open(options.output, "w")
+
+    cache = None
+    if options.cache is not None:
+        cache = SolutionCache(options.cache)
+
+    with multiprocessing.Pool(max(1, options.jobs), _init_worker,
+            (options.space,)) as pool:
+        if cache is None:
+            results = pool.imap_unordered(solve, tasks)
+        else:
+            results = solve_cached(pool, cache, read_puzzles(options.paths),
+                options.method, options.pdb, options.time)
+        for result in results:
+            result.pop("codes", None)
+            print(json.dumps(result), file=out, flush=True)
+
+    if cache is not None:
+        cache.save()
+
+    if out is not sys.stdout:
+        out.close()
+
+if __name__ == '__main__':
+    main()
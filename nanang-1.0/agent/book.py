@@ -0,0 +1,205 @@
+"""
+An opening book for three player Chexers.
+
+Every game starts from the same position, so the first few moves can be
+searched deeply once, offline, instead of again in every game:
+
+    python -m agent.book -p 6 -w 3 -t 5
+
+walks the early game tree from the start (every position reached by the
+best move and the next few most promising moves of each player, for the
+given number of plies), searches every position for the given number of
+seconds, and writes the (position key, best move) pairs to a file.
+
+The file is a sorted table of 10 byte entries, a 64-bit key (see
+game.zobrist.position_key) and a 16-bit encoded move (see Move.encode),
+packed into blocks the size of a memory page, after a header block. Opening
+it only reads the first key of every block, and a lookup memory maps the one
+block that can hold the key, binary searches it and unmaps it again, so that
+lookups are almost free and the referee, which counts the virtual memory of
+the process against its -s limit, never sees more than a page of the book.
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from bisect import bisect_right
+
+from game.bitboard import BitBoard
+from game.move import Move
+from game.zobrist import position_key
+from agent import storage
+
+COLOURS = ["R", "G", "B"]
+
+_MAGIC = b"NBOOK\x01"
+_HEADER = struct.Struct("<6s2xQ")
+_ENTRY = struct.Struct("<QH")
+
+# the size of a block, which has to be a multiple of mmap's granularity.
+BLOCK = mmap.ALLOCATIONGRANULARITY
+PER_BLOCK = BLOCK // _ENTRY.size
+
+def default_book_path():
+    """Where the book is written and read by default (see agent.storage)."""
+    return os.path.join(storage.cache_dir(), "opening.book")
+
+class OpeningBook:
+    """
+    A book file opened for lookups.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        # (padded, so that a file too short for a header fails the check
+        # below rather than the unpack)
+        header = self._file.read(_HEADER.size)
+        magic, self._count = _HEADER.unpack(header.ljust(_HEADER.size, b"\0"))
+        blocks = (self._count + PER_BLOCK - 1) // PER_BLOCK
+        size = os.fstat(self._file.fileno()).st_size
+        if magic != _MAGIC or size != (blocks + 1) * BLOCK:
+            self._file.close()
+            raise ValueError(f"{path} is not an opening book")
+
+        # the first key of every block.
+        self._firsts = array("Q")
+        for block in range(blocks):
+            self._file.seek((block + 1) * BLOCK)
+            self._firsts.append(_ENTRY.unpack(
+                self._file.read(_ENTRY.size))[0])
+
+    @staticmethod
+    def write(path, entries):
+        """
+        Writes a book file.
+
+        :param entries: dict of position keys to encoded moves
+        """
+        keys = sorted(entries)
+        with storage.atomic_write(path) as f:
+            f.write(_HEADER.pack(_MAGIC, len(keys)).ljust(BLOCK, b"\0"))
+            for start in range(0, len(keys), PER_BLOCK):
+                block = b"".join(_ENTRY.pack(key, entries[key])
+                    for key in keys[start:start + PER_BLOCK])
+                f.write(block.ljust(BLOCK, b"\0"))
+
+    def lookup(self, key):
+        """
+        Returns the encoded move stored for a position key, or None.
+        """
+        block = bisect_right(self._firsts, key) - 1
+        if block < 0:
+            return None
+        n = min(PER_BLOCK, self._count - block * PER_BLOCK)
+        data = mmap.mmap(self._file.fileno(), BLOCK,
+            offset=(block + 1) * BLOCK, access=mmap.ACCESS_READ)
+        try:
+            low, high = 0, n
+            while low < high:
+                mid = (low + high) // 2
+                found, code = _ENTRY.unpack_from(data, mid * _ENTRY.size)
+                if found == key:
+                    return code
+                elif found < key:
+                    low = mid + 1
+                else:
+                    high = mid
+            return None
+        finally:
+            data.close()
+
+    def move(self, board, nturns):
+        """
+        Returns the book move for the player to move on a board, or None if
+        the position is not in the book.
+
+        :param nturns: the number of turns played so far in the game
+        """
+        colour = COLOURS[nturns % 3]
+        code = self.lookup(position_key(board, colour))
+        if code is None:
+            return None
+        return Move.decode(colour, code)
+
+    def close(self):
+        self._file.close()
+
+    def __len__(self):
+        return self._count
+
+def build(plies, width, seconds, log=None):
+    """
+    Searches the early game tree and returns the book entries.
+
+    :param plies: how many turns deep into the game the book goes
+    :param width: how many moves of each position are followed, the best
+    move and then the most promising others (in Search's move order)
+    :param seconds: the CPU time to search each position for
+    :param log: file to report progress to
+    :return: dict of position keys to encoded best moves
+    """
+    # agent.multiplayer plays from the book, so only import it here.
+    from agent.multiplayer import Search
+
+    # a Search's table is only good for one root colour.
+    searches = {colour: Search() for colour in COLOURS}
+    entries = {}
+
+    def visit(board, nturns):
+        colour = COLOURS[nturns % 3]
+        key = position_key(board, colour)
+        if key in entries:
+            #reached again by another order of the same moves
+            return
+        search = searches[colour]
+        best = search.best_move(board, nturns, seconds)
+        if best is None:
+            return
+        entries[key] = best.encode()
+        if log is not None:
+            print(f"{len(entries):6d}  turn {nturns:2d}  {best}  (depth "
+                f"{search.depth}, {search.nodes} nodes)", file=log, flush=True)
+
+        if nturns + 1 >= plies:
+            return
+        others = [m for m in search._ordered_moves(board, colour)
+            if not (m.source == best.source and m.dest == best.dest)]
+        for move in [best] + others[:width - 1]:
+            token = board.apply(move)
+            try:
+                visit(board, nturns + 1)
+            finally:
+                board.undo(token)
+
+    visit(BitBoard(BitBoard.starting_board_dict()), 0)
+    return entries
+
+def get_options():
+    """Parse and return command-line arguments."""
+    parser = argparse.ArgumentParser(prog="agent.book",
+        description="builds an opening book for three player Chexers.")
+    parser.add_argument("-p", "--plies", type=int, default=6,
+        help="how many turns into the game to go (default: 6)")
+    parser.add_argument("-w", "--width", type=int, default=3,
+        help="moves followed from every position (default: 3)")
+    parser.add_argument("-t", "--time", type=float, default=5.0,
+        help="CPU time (float, seconds) to search every position for "
+            "(default: 5)")
+    parser.add_argument("-o", "--output", default=None,
+        help=f"file to write the book to (default: {default_book_path()})")
+    return parser.parse_args()
+
+def main():
+    options = get_options()
+    path = options.output
+    if path is None:
+        path = default_book_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    entries = build(options.plies, options.width, options.time, sys.stderr)
+    OpeningBook.write(path, entries)
+    print(f"wrote {len(entries)} positions to {path}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
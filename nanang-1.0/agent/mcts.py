@@ -0,0 +1,399 @@
+"""
+A Monte Carlo tree search agent for three player Chexers, with the same
+action()/update() interface as agent.multiplayer:
+
+    PYTHONPATH=.. python -m referee agent.mcts agent.multiplayer agent.mcts
+
+Instead of an evaluation function it plays the game out to the end from every
+new leaf, many times over, and backs up a reward vector (one reward per
+colour: 1 for a win, 1/3 each for a draw) so that every player picks its
+moves by its own reward (UCT).
+
+The tree is walked on a Board with apply/undo, but the playouts run on a
+much smaller state of their own: one byte per hex, a list of piece hexes per
+colour and the exit counts, with moves as ints and the move buffers
+allocated once. Playouts are what limit the strength of the agent, so that
+loop is kept as tight as possible.
+"""
+import sys
+import math
+import time
+import random
+
+from game.board import Board
+from game.move import Move, HEX_INDEX, JUMP_MID, EXITS, EXIT_DISTANCE, \
+    WIN_EXITS, MAX_TURNS
+from game.packed import NEIGHBOUR_INDEX, JUMP_INDEX
+from agent.multiplayer import COLOURS, NAMES, Search, to_action, from_action
+from agent.timing import TimeManager
+
+# what is on each hex of a playout state.
+EMPTY, BLOCK = 0, 4
+
+# _MID[src][dest] is the hex jumped over from src to dest, or -1.
+_MID = [[-1] * len(HEX_INDEX) for _ in HEX_INDEX]
+for (_src, _dest), _mid in JUMP_MID.items():
+    _MID[HEX_INDEX[_src]][HEX_INDEX[_dest]] = HEX_INDEX[_mid]
+
+# per colour (in COLOURS order), by hex number: whether a piece there can
+# exit, and its steps and jumps split into those that get closer to the exits
+# (forward) and the rest.
+_EXITABLE = []
+_FORWARD_STEPS, _OTHER_STEPS = [], []
+_FORWARD_JUMPS, _OTHER_JUMPS = [], []
+for _colour in COLOURS:
+    _dist = [EXIT_DISTANCE[_colour][x] for x in Move.BOARD_RANGE]
+    _EXITABLE.append([x in EXITS[_colour] for x in Move.BOARD_RANGE])
+    _FORWARD_STEPS.append([[x for x in NEIGHBOUR_INDEX[i]
+        if _dist[x] < _dist[i]] for i in range(len(_dist))])
+    _OTHER_STEPS.append([[x for x in NEIGHBOUR_INDEX[i]
+        if _dist[x] >= _dist[i]] for i in range(len(_dist))])
+    _FORWARD_JUMPS.append([[(x, mid) for x, mid in JUMP_INDEX[i]
+        if _dist[x] < _dist[i]] for i in range(len(_dist))])
+    _OTHER_JUMPS.append([[(x, mid) for x, mid in JUMP_INDEX[i]
+        if _dist[x] >= _dist[i]] for i in range(len(_dist))])
+
+_EMPTY_CELLS = bytes(len(HEX_INDEX))
+
+class Playout:
+    """
+    Plays games out to the end from a Board, with a simple policy: exit when
+    possible, otherwise usually make a move that gets closer to an exit or
+    captures, and otherwise one of the other moves.
+    """
+
+    def __init__(self, rng, greed=0.9):
+        """
+        :param rng: the random.Random to make the moves with
+        :param greed: how often a move forwards is taken over any move
+        """
+        self.random = rng.random
+        self.greed = greed
+        self.count = 0
+        self._cells = bytearray(len(HEX_INDEX))
+        # room for every move of 12 pieces.
+        self._good = [0] * 160
+        self._rest = [0] * 160
+
+    def run(self, board, nturns):
+        """
+        Plays one game out from a board, without changing it.
+
+        :param nturns: the number of turns played to reach the board
+        :return: the index (in COLOURS) of the winner, or -1 for a draw
+        """
+        cells = self._cells
+        cells[:] = _EMPTY_CELLS
+        pieces = []
+        exits = []
+        for c, colour in enumerate(COLOURS):
+            mine = [HEX_INDEX[x] for x in board.pieces_of(colour)]
+            for i in mine:
+                cells[i] = c + 1
+            pieces.append(mine)
+            exits.append(board.exits_of(colour))
+        for cell in Move.BOARD_RANGE:
+            if board.controller_at(cell) == "X":
+                cells[HEX_INDEX[cell]] = BLOCK
+        self.count += 1
+        return self._play(cells, pieces, exits, nturns, 3 * MAX_TURNS)
+
+    def _play(self, cells, pieces, exits, nturns, limit):
+        # plays from the state until someone wins or nturns reaches limit.
+        rand = self.random
+        greed = self.greed
+        good, rest = self._good, self._rest
+
+        while nturns < limit:
+            c = nturns % 3
+            nturns += 1
+            me = c + 1
+            mine = pieces[c]
+            exitable = _EXITABLE[c]
+
+            # list the forward moves and captures as k * 64 + dest, where k
+            # is the place of the piece in mine, unless there is an exit.
+            forward_steps = _FORWARD_STEPS[c]
+            forward_jumps = _FORWARD_JUMPS[c]
+            other_jumps = _OTHER_JUMPS[c]
+            ngood = 0
+            exited = -1
+            for k in range(len(mine)):
+                src = mine[k]
+                if exitable[src]:
+                    exited = k
+                    break
+                for dest in forward_steps[src]:
+                    if cells[dest] == EMPTY:
+                        good[ngood] = k * 64 + dest
+                        ngood += 1
+                for dest, mid in forward_jumps[src]:
+                    if cells[dest] == EMPTY and cells[mid] != EMPTY:
+                        good[ngood] = k * 64 + dest
+                        ngood += 1
+                for dest, mid in other_jumps[src]:
+                    if cells[dest] == EMPTY:
+                        owner = cells[mid]
+                        if owner != EMPTY and owner != me and owner != BLOCK:
+                            good[ngood] = k * 64 + dest
+                            ngood += 1
+
+            if exited >= 0:
+                cells[mine[exited]] = EMPTY
+                mine[exited] = mine[-1]
+                mine.pop()
+                exits[c] += 1
+                if exits[c] >= WIN_EXITS:
+                    return c
+                continue
+
+            code = -1
+            if ngood and rand() < greed:
+                code = good[int(rand() * ngood)]
+            else:
+                # only now list the rest of the moves.
+                other_steps = _OTHER_STEPS[c]
+                nrest = 0
+                for k in range(len(mine)):
+                    src = mine[k]
+                    for dest in other_steps[src]:
+                        if cells[dest] == EMPTY:
+                            rest[nrest] = k * 64 + dest
+                            nrest += 1
+                    for dest, mid in other_jumps[src]:
+                        if cells[dest] == EMPTY:
+                            owner = cells[mid]
+                            if owner == me or owner == BLOCK:
+                                rest[nrest] = k * 64 + dest
+                                nrest += 1
+                if nrest:
+                    code = rest[int(rand() * nrest)]
+                elif ngood:
+                    code = good[int(rand() * ngood)]
+            if code < 0:
+                #no moves, so pass
+                continue
+
+            k, dest = code >> 6, code & 63
+            src = mine[k]
+            cells[src] = EMPTY
+            cells[dest] = me
+            mine[k] = dest
+            mid = _MID[src][dest]
+            if mid >= 0:
+                owner = cells[mid]
+                if owner != me and owner != BLOCK:
+                    cells[mid] = me
+                    pieces[owner - 1].remove(mid)
+                    mine.append(mid)
+        return -1
+
+class Node:
+    """
+    A node of the search tree: the position after move was played by the
+    colour with index mover.
+    """
+    __slots__ = ("move", "mover", "parent", "children", "untried", "visits",
+        "rewards")
+
+    def __init__(self, move, mover, parent=None):
+        self.move = move
+        self.mover = mover
+        self.parent = parent
+        self.children = []
+        # the moves not expanded yet, listed the first time the node is
+        # reached (so that leaves don't pay for it).
+        self.untried = None
+        self.visits = 0
+        self.rewards = [0.0, 0.0, 0.0]
+
+class MCTS:
+    """
+    UCT over a Board, keeping its tree between calls so that the part below
+    the moves actually played can be reused.
+    """
+
+    def __init__(self, seed=None, exploration=1.0, greed=0.9):
+        """
+        :param seed: seed for the playouts, for repeatable searches
+        :param exploration: the UCT exploration constant
+        :param greed: the playout policy's preference for moves forwards
+        """
+        self.rng = random.Random(seed)
+        self.exploration = exploration
+        self.playout = Playout(self.rng, greed)
+        self.root = None
+        self.nturns = 0
+
+    def reset(self, nturns):
+        # starts a new tree at the position after nturns turns.
+        self.root = Node(None, (nturns - 1) % 3)
+        self.nturns = nturns
+
+    def advance(self, move):
+        """
+        Moves the root down past a move that was played (None for a pass),
+        keeping what was found out about the position after it.
+        """
+        if self.root is not None:
+            for child in self.root.children:
+                if _same_move(child.move, move):
+                    child.parent = None
+                    self.root = child
+                    self.nturns += 1
+                    return
+        self.reset(self.nturns + 1)
+
+    def search(self, board, stop):
+        """
+        Runs iterations from the root until stop() says to finish (it is
+        checked between iterations, after the first one, so that the root
+        always has a move to play).
+
+        :param board: the board at the root, put back how it was afterwards
+        :return: the number of playouts run
+        """
+        if self.root is None:
+            self.reset(self.nturns)
+        count = 0
+        while count == 0 or not stop(count):
+            self._iterate(board)
+            count += 1
+        return count
+
+    def best(self):
+        """
+        Returns the most visited move at the root (None for a pass).
+        """
+        if not self.root.children:
+            return None
+        return max(self.root.children, key=lambda x: x.visits).move
+
+    def _iterate(self, board):
+        node = self.root
+        nturns = self.nturns
+        tokens = []
+        try:
+            # select down through fully expanded nodes.
+            winner = _winner(board, nturns)
+            while winner is None and node.untried == [] and node.children:
+                node = self._select(node)
+                if node.move is not None:
+                    tokens.append(board.apply(node.move))
+                nturns += 1
+                winner = _winner(board, nturns)
+
+            # expand one new child.
+            if winner is None:
+                if node.untried is None:
+                    node.untried = self._moves(board, nturns)
+                move = node.untried.pop()
+                child = Node(move, nturns % 3, node)
+                node.children.append(child)
+                node = child
+                if move is not None:
+                    tokens.append(board.apply(move))
+                nturns += 1
+                winner = _winner(board, nturns)
+                if winner is None:
+                    winner = self.playout.run(board, nturns)
+        finally:
+            for token in reversed(tokens):
+                board.undo(token)
+
+        # back the rewards up to the root.
+        while node is not None:
+            node.visits += 1
+            if winner >= 0:
+                node.rewards[winner] += 1.0
+            else:
+                for c in range(3):
+                    node.rewards[c] += 1.0 / 3
+            node = node.parent
+
+    def _select(self, node):
+        # picks the child with the best upper confidence bound for its mover.
+        log_n = math.log(node.visits)
+        c = self.exploration
+        best, best_value = None, -math.inf
+        for child in node.children:
+            value = (child.rewards[child.mover] / child.visits
+                + c * math.sqrt(log_n / child.visits))
+            if value > best_value:
+                best, best_value = child, value
+        return best
+
+    @staticmethod
+    def _moves(board, nturns):
+        # the moves to expand, the most promising last (as they are popped).
+        moves = Search._ordered_moves(board, COLOURS[nturns % 3])
+        if len(moves) == 0:
+            return [None]
+        moves.reverse()
+        return moves
+
+def _winner(board, nturns):
+    # the index of the winner of a finished game (-1 for a draw), or None.
+    for c, colour in enumerate(COLOURS):
+        if board.exits_of(colour) >= WIN_EXITS:
+            return c
+    if nturns >= 3 * MAX_TURNS:
+        return -1
+    return None
+
+def _same_move(a, b):
+    if a is None or b is None:
+        return a is b
+    return a.source == b.source and a.dest == b.dest
+
+class Player:
+    """
+    The referee's interface to the tree search.
+    """
+
+    def __init__(self, colour, seed=None, time_limit=60.0, report=True):
+        """
+        :param colour: "red", "green" or "blue"
+        :param seed: seed for the search, for repeatable games
+        :param time_limit: the referee's CPU time limit for the game (its -t
+        option), 0 for none
+        :param report: print playout statistics to stderr after every action
+        """
+        self.timer = TimeManager(time_limit)
+        with self.timer:
+            self.colour = NAMES[colour]
+            self.board = Board(Board.starting_board_dict())
+            self.nturns = 0
+            self.mcts = MCTS(seed)
+            self.report = report
+
+    def action(self):
+        with self.timer:
+            moves = self.board.possible_moves(self.colour)
+            if len(moves) <= 1:
+                #no choice to make, so don't spend any time on it
+                return to_action(moves[0] if moves else None)
+            budget = self.timer.plan(self.board, self.colour, self.nturns,
+                len(moves))
+            start = time.process_time()
+            playouts = self.mcts.playout.count
+            count = self.mcts.search(self.board,
+                lambda count: budget.elapsed() >= budget.soft)
+            elapsed = time.process_time() - start
+            playouts = self.mcts.playout.count - playouts
+            move = self.mcts.best()
+            if self.report and count > 0:
+                # iterations that end in a finished game need no playout.
+                print(f"* mcts ({self.colour}): {playouts} playouts in "
+                    f"{elapsed:.3f}s ({playouts / max(elapsed, 1e-9):.0f}/s), "
+                    f"{count} iterations, {self.mcts.root.visits} visits at "
+                    f"the root", file=sys.stderr)
+            return to_action(move)
+
+    def update(self, colour, action):
+        with self.timer:
+            move = from_action(NAMES[colour], action)
+            if move is not None:
+                self.board.apply(move)
+            self.nturns += 1
+            self.mcts.advance(move)
@@ -0,0 +1,456 @@
+"""
+A three player Chexers agent, with the action()/update() interface the
+referee expects.
+
+The referee imports players by module name, so run it from the nanang-1.0
+directory with the referee package on the path, for example:
+
+    PYTHONPATH=.. python -m referee agent.multiplayer agent.multiplayer \
+        agent.multiplayer
+
+The agent keeps its own board (a game.bitboard.BitBoard, with jump captures,
+as the referee plays them) and picks its moves with an iterative deepening
+search, either max^n (every player maximises their own score) or paranoid
+alpha-beta (the other two players are assumed to be working together against
+us). How boards are scored is up to the evaluation function it is given.
+"""
+import os
+import math
+import time
+
+from game.bitboard import BitBoard
+from game.zobrist import position_key
+from agent.timing import MoveBudget, TimeManager
+from agent import vectorised
+from agent.book import OpeningBook, default_book_path
+from agent.tablebase import (Tablebase, default_tablebase_path, MAX_PIECES,
+    WON, LOST)
+from agent.transposition import (TranspositionTable, EXACT, LOWER, UPPER,
+    ORDER, NO_MOVE)
+from game.move import Move, JUMP_MID, EXIT_DISTANCE, WIN_EXITS, MAX_TURNS
+
+COLOURS = ["R", "G", "B"]
+NAMES = {"red": "R", "green": "G", "blue": "B"}
+
+# the score of a won (or lost) game.
+WIN = 100000.0
+
+def to_action(move):
+    """
+    Turns a Move (or None, for a pass) into the referee's action format.
+    """
+    if move is None:
+        return ("PASS", None)
+    elif move.dest is None:
+        return ("EXIT", move.source)
+    elif (move.source, move.dest) in JUMP_MID:
+        return ("JUMP", (move.source, move.dest))
+    return ("MOVE", (move.source, move.dest))
+
+def from_action(controller, action):
+    """
+    Turns one of the referee's actions into a Move (or None, for a pass).
+    """
+    atype, aargs = action
+    if atype == "PASS":
+        return None
+    elif atype == "EXIT":
+        return Move(controller, tuple(aargs), None)
+    return Move(controller, tuple(aargs[0]), tuple(aargs[1]))
+
+def default_evaluation(board, colour):
+    """
+    Scores a board for one colour, higher is better. Exited pieces count the
+    most, then pieces that are needed to win, the closer to their exit the
+    better, then any spare pieces (which can still capture and be captured).
+    Not having enough pieces left to win is heavily penalised.
+
+    Any function with the same signature can be given to Search instead.
+    """
+    exits = board.exits_of(colour)
+    needed = WIN_EXITS - exits
+    distances = sorted(EXIT_DISTANCE[colour][x]
+        for x in board.pieces_of(colour))
+
+    score = 100.0 * exits
+    for distance in distances[:needed]:
+        score += 30.0 - 4.0 * distance
+    score += 5.0 * max(0, len(distances) - needed)
+    score -= 60.0 * max(0, needed - len(distances))
+    return score
+
+class _Timeout(Exception):
+    """Raised inside a search when its time is up."""
+
+class Search:
+    """
+    Iterative deepening game tree search over a Board (or a BitBoard), walking
+    the tree with apply/undo so that it never copies the board.
+    """
+
+    def __init__(self, evaluate=default_evaluation, mode="paranoid",
+            table_bytes=8 * 1024 * 1024, vectorise=True, tablebase=None):
+        """
+        :param evaluate: function scoring a board for a colour (see
+        default_evaluation)
+        :param mode: "paranoid" for paranoid alpha-beta, or "maxn"
+        :param table_bytes: memory for the transposition table, 0 for none
+        :param vectorise: in max^n, score all the children of a node one ply
+        above the leaves in one go with agent.vectorised, which is only
+        possible with the default evaluation and NumPy installed. Paranoid
+        search doesn't, as alpha-beta cuts most of those children off.
+        :param tablebase: a Tablebase (see agent.tablebase) to look up the
+        exact outcome of leaves with few enough pieces left in, or None
+        """
+        assert(mode in {"paranoid", "maxn"})
+        self.evaluate = evaluate
+        self.mode = mode
+        self.vectorise = (vectorise and vectorised.AVAILABLE
+            and evaluate is default_evaluation and mode == "maxn")
+        if self.vectorise:
+            # before the search starts, so the clock doesn't run while it is.
+            vectorised.load()
+        self.tablebase = tablebase
+        # kept from one move to the next. Paranoid values are from the point
+        # of view of the root player, so a Search must always play the same
+        # colour while it has a table.
+        self.table = None
+        if table_bytes:
+            self.table = TranspositionTable(table_bytes)
+        # statistics of the last call to best_move.
+        self.nodes = 0
+        self.depth = 0
+
+    def best_move(self, board, nturns, budget, max_depth=64):
+        """
+        Searches deeper and deeper until the budget says to stop, and returns
+        the best move of the last search that finished (None means pass).
+
+        :param board: the board, which is put back how it was afterwards
+        :param nturns: the number of turns played so far in the game, which
+        says whose turn it is
+        :param budget: a MoveBudget (see agent.timing), or seconds of CPU time
+        the search may use
+        """
+        if not isinstance(budget, MoveBudget):
+            budget = MoveBudget(budget, budget)
+        colour = COLOURS[nturns % 3]
+        moves = self._ordered_moves(board, colour)
+        self.nodes = 0
+        self.depth = 0
+        if len(moves) <= 1:
+            #no choice to make, so don't spend any time on it
+            return moves[0] if moves else None
+
+        self._deadline = budget.deadline
+        self._root = colour
+        if self.table is not None:
+            self.table.new_search()
+        best = moves[0]
+        for depth in range(1, max_depth + 1):
+            started = time.process_time()
+            try:
+                found, value = self._search_root(board, nturns, depth, moves)
+            except _Timeout:
+                break
+            if depth > 2 and found is not best:
+                #the answer is not settled yet, so it is worth more time
+                budget.extend()
+            best = found
+            self.depth = depth
+            #search the best move first next time, it makes for better cutoffs
+            moves.remove(best)
+            moves.insert(0, best)
+            if abs(value) >= WIN:
+                #the result is decided, looking deeper won't change it
+                break
+            if not budget.should_deepen(time.process_time() - started):
+                break
+        return best
+
+    def _search_root(self, board, nturns, depth, moves):
+        # searches every move at the root, returning the best and its value.
+        colour = self._root
+        best, best_value = None, -math.inf
+        alpha, beta = -math.inf, math.inf
+        for move in moves:
+            token = board.apply(move)
+            try:
+                if self.mode == "paranoid":
+                    value = self._paranoid(board, nturns + 1, depth - 1,
+                        alpha, beta)
+                else:
+                    value = self._maxn(board, nturns + 1, depth - 1)[
+                        COLOURS.index(colour)]
+            finally:
+                board.undo(token)
+            if value > best_value:
+                best, best_value = move, value
+                alpha = max(alpha, value)
+        return best, best_value
+
+    def _tick(self):
+        # counts a node, checking the clock every so often.
+        self.nodes += 1
+        if self.nodes % 1024 == 0 and time.process_time() > self._deadline:
+            raise _Timeout()
+
+    def _outcome(self, board, nturns, depth):
+        """
+        Returns the vector of scores of a finished game, or None if the game
+        is still going. Quicker wins (more depth left) score higher.
+        """
+        for i, colour in enumerate(COLOURS):
+            if board.exits_of(colour) >= WIN_EXITS:
+                values = [-WIN - depth] * 3
+                values[i] = WIN + depth
+                return values
+        if nturns >= MAX_TURNS * 3:
+            return [0.0, 0.0, 0.0]
+        return None
+
+    def _in_tablebase(self, board):
+        # whether the tablebase can have the outcome of a board.
+        if self.tablebase is None:
+            return False
+        total = 0
+        for colour in COLOURS:
+            total += board.count_of(colour)
+        return total == MAX_PIECES
+
+    def _paranoid(self, board, nturns, depth, alpha, beta):
+        """
+        Paranoid alpha-beta: the root player maximises its score minus the
+        best score of the others, and the others minimise it.
+        """
+        self._tick()
+        me = COLOURS.index(self._root)
+        outcome = self._outcome(board, nturns, depth)
+        if outcome is not None:
+            return outcome[me]
+        if depth == 0:
+            scores = [self.evaluate(board, colour) for colour in COLOURS]
+            value = scores[me] - max(scores[:me] + scores[me+1:])
+            if self._in_tablebase(board):
+                # a known result outranks any guess, but the guess is kept to
+                # tell apart the moves that get closer to it.
+                result = self.tablebase.probe(board, nturns, self._root)
+                if result == WON:
+                    value += WIN / 2
+                elif result == LOST:
+                    value -= WIN / 2
+            return value
+
+        colour = COLOURS[nturns % 3]
+        table = self.table
+        first = NO_MOVE
+        if table is not None:
+            key = position_key(board, colour)
+            slot = table.probe(key)
+            if slot >= 0:
+                first = table.move[slot]
+                if table.depth[slot] >= depth and table.flag[slot] != ORDER:
+                    value, flag = table.value[slot], table.flag[slot]
+                    if (flag == EXACT or (flag == LOWER and value >= beta)
+                            or (flag == UPPER and value <= alpha)):
+                        return value
+
+        moves = self._ordered_moves(board, colour, first)
+        if len(moves) == 0:
+            #the only thing to do is pass
+            return self._paranoid(board, nturns + 1, depth - 1, alpha, beta)
+
+        maximising = colour == self._root
+        window = (alpha, beta)
+        best = -math.inf if maximising else math.inf
+        best_move = moves[0]
+        for move in moves:
+            token = board.apply(move)
+            try:
+                value = self._paranoid(board, nturns + 1, depth - 1, alpha,
+                    beta)
+            finally:
+                board.undo(token)
+            if (value > best) if maximising else (value < best):
+                best, best_move = value, move
+            if maximising:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+
+        if table is not None:
+            if best <= window[0]:
+                flag = UPPER
+            elif best >= window[1]:
+                flag = LOWER
+            else:
+                flag = EXACT
+            table.store(key, depth, flag, best, best_move.encode())
+        return best
+
+    def _maxn(self, board, nturns, depth):
+        """
+        max^n: returns the vector of scores (in COLOURS order) that the
+        player to move can get, each player maximising their own score.
+        """
+        self._tick()
+        outcome = self._outcome(board, nturns, depth)
+        if outcome is not None:
+            return outcome
+        if depth == 0:
+            values = [self.evaluate(board, colour) for colour in COLOURS]
+            if self._in_tablebase(board):
+                # a colour that can win against any play wins under max^n too.
+                for i, colour in enumerate(COLOURS):
+                    if (self.tablebase.probe(board, nturns, colour)
+                            == WON):
+                        values[i] += WIN / 2
+            return values
+
+        colour = COLOURS[nturns % 3]
+        # max^n values are vectors, so the table only helps with the order.
+        table = self.table
+        first = NO_MOVE
+        if table is not None:
+            key = position_key(board, colour)
+            slot = table.probe(key)
+            if slot >= 0:
+                first = table.move[slot]
+
+        moves = self._ordered_moves(board, colour, first)
+        if len(moves) == 0:
+            return self._maxn(board, nturns + 1, depth - 1)
+
+        leaves = None
+        if (depth == 1 and self.vectorise and nturns + 1 < MAX_TURNS * 3
+                and not self._in_tablebase(board)):
+            leaves = self._leaf_values(board, moves)
+
+        i = COLOURS.index(colour)
+        best, best_move = None, None
+        for j, move in enumerate(moves):
+            if leaves is not None:
+                self._tick()
+                values = leaves[j]
+            else:
+                token = board.apply(move)
+                try:
+                    values = self._maxn(board, nturns + 1, depth - 1)
+                finally:
+                    board.undo(token)
+            if best is None or values[i] > best[i]:
+                best, best_move = values, move
+
+        if table is not None:
+            table.store(key, depth, ORDER, 0.0, best_move.encode())
+        return best
+
+    @staticmethod
+    def _leaf_values(board, moves):
+        """
+        Returns the score vectors of the boards after each of the moves, as
+        _maxn would find them with no depth left, without making any of the
+        moves.
+        """
+        cells, exits = vectorised.expand(board, moves)
+        values = vectorised.scores(cells, exits).tolist()
+        # only the colour that moved can have just won.
+        c = COLOURS.index(moves[0].controller)
+        for row, done in zip(values, (exits[:, c] >= WIN_EXITS).tolist()):
+            if done:
+                row[:] = [-WIN] * 3
+                row[c] = WIN
+        return values
+
+    @staticmethod
+    def _ordered_moves(board, colour, first=NO_MOVE):
+        """
+        Lists the moves of a colour, the most promising first: the move with
+        the encoding first (the best move found here before), then exits, then
+        captures, then moves towards the exits.
+        """
+        distance = EXIT_DISTANCE[colour]
+        ranked = []
+        for move in board.possible_moves(colour):
+            if move.dest is None:
+                rank = 0
+            else:
+                rank = 10 + distance[move.dest] - distance[move.source]
+                mid = JUMP_MID.get((move.source, move.dest))
+                if (mid is not None
+                        and board.controller_at(mid) not in (colour, "X")):
+                    rank -= 5
+            if first != NO_MOVE and move.encode() == first:
+                rank = -1
+            ranked.append((rank, move))
+        ranked.sort(key=lambda x: x[0])
+        return [move for _, move in ranked]
+
+class Player:
+    """
+    The referee's interface to the search.
+    """
+
+    def __init__(self, colour, mode="paranoid", evaluate=default_evaluation,
+            time_limit=60.0, book=None, tablebase=None):
+        """
+        :param colour: "red", "green" or "blue"
+        :param mode: the Search mode to use
+        :param evaluate: the Search evaluation function to use
+        :param time_limit: the referee's CPU time limit for the game (its -t
+        option, which players are not told), 0 for none
+        :param book: the opening book file to play from (see agent.book),
+        by default the one agent.book writes if it has been built (and, as
+        for the tablebase, ignored if it can't be read)
+        :param tablebase: the endgame tablebase file (see agent.tablebase),
+        by default the one agent.tablebase writes if it has been built. A
+        file that isn't a table this version can read is ignored.
+        """
+        self.timer = TimeManager(time_limit)
+        with self.timer:
+            self.colour = NAMES[colour]
+            self.board = BitBoard(BitBoard.starting_board_dict())
+            self.nturns = 0
+            if tablebase is None:
+                tablebase = default_tablebase_path()
+            endgame = None
+            if os.path.exists(tablebase):
+                try:
+                    endgame = Tablebase.load(tablebase)
+                except ValueError:
+                    #say, one built in an older format: play without it
+                    endgame = None
+            self.search = Search(evaluate, mode, tablebase=endgame)
+            if book is None:
+                book = default_book_path()
+            self.book = None
+            if os.path.exists(book):
+                try:
+                    self.book = OpeningBook(book)
+                except ValueError:
+                    self.book = None
+
+    def action(self):
+        with self.timer:
+            if self.book is not None:
+                move = self.book.move(self.board, self.nturns)
+                if move is None:
+                    # once out of the book there is no getting back in.
+                    self.book.close()
+                    self.book = None
+                elif self.board.valid_move(move):
+                    return to_action(move)
+            n_moves = len(self.board.possible_moves(self.colour))
+            budget = self.timer.plan(self.board, self.colour, self.nturns,
+                n_moves)
+            move = self.search.best_move(self.board, self.nturns, budget)
+            return to_action(move)
+
+    def update(self, colour, action):
+        with self.timer:
+            move = from_action(NAMES[colour], action)
+            if move is not None:
+                self.board.apply(move)
+            self.nturns += 1
@@ -0,0 +1,229 @@
+"""
+Root parallel Monte Carlo tree search across CPU cores.
+
+Every worker process builds its own agent.mcts tree from the same position,
+with its own seed, and writes the visits of the moves at its root, and the
+rewards the player to move got from them, into one row of a block of shared
+memory. The rows are then added up (in worker order, so the sums are always
+the same) and the most visited move is played, the most rewarded one if some
+are visited equally often. The workers share nothing while they search, which is what lets them
+run flat out on separate cores.
+
+Given a seed, each worker runs a fixed number of iterations instead of
+searching for a fixed time, so that a game can be replayed exactly. With a
+single core (or workers=1) the same search runs in the agent's own process.
+
+    PYTHONPATH=.. python -m referee agent.parallel agent.mcts agent.mcts
+"""
+import os
+import sys
+import time
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+
+from game.board import Board
+from game.move import Move
+from agent.mcts import MCTS
+from agent.multiplayer import COLOURS, NAMES, Search, to_action, from_action
+from agent.timing import TimeManager
+
+# the most moves a root can have (every move of 12 pieces, or a pass).
+MAX_ROOT_MOVES = 160
+
+# each root move gets its visits and then its reward for the player to move.
+_FIELDS = 2
+_ROW = MAX_ROOT_MOVES * _FIELDS
+
+# the shared memory a worker has attached to, by name.
+_attached = {}
+
+def _attach(name):
+    # attaches to the statistics block once per worker process.
+    if name not in _attached:
+        # workers share the agent's resource tracker, which unlinks the
+        # block if the agent dies without doing it itself.
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    return _attached[name]
+
+def search_root(task):
+    """
+    Runs one worker's search and writes its root statistics into its row of
+    the shared block.
+
+    :param task: (row, board dictionary, exits by colour, turns played,
+    encoded root moves, seed, seconds, iterations, shared block name), where
+    a pass is encoded as -1 and iterations (if not 0) overrides seconds
+    :return: the number of playouts the worker ran
+    """
+    (row, board_dict, exits, nturns, codes, seed, seconds, iterations,
+        name) = task
+    board = Board(board_dict, dict(exits))
+    colour = COLOURS[nturns % 3]
+    moves = [None if code < 0 else Move.decode(colour, code)
+        for code in codes]
+
+    mcts = MCTS(seed)
+    mcts.reset(nturns)
+    # expand the moves in the same order in every worker.
+    mcts.root.untried = list(reversed(moves))
+    if iterations:
+        stop = lambda count: count >= iterations
+    else:
+        deadline = time.process_time() + seconds
+        stop = lambda count: time.process_time() >= deadline
+    mcts.search(board, stop)
+
+    index = {code: i for i, code in enumerate(codes)}
+    stats = _attach(name).buf.cast("d")
+    try:
+        start = row * _ROW
+        for i in range(start, start + len(codes) * _FIELDS):
+            stats[i] = 0.0
+        for child in mcts.root.children:
+            code = -1 if child.move is None else child.move.encode()
+            at = start + index[code] * _FIELDS
+            stats[at] = child.visits
+            stats[at + 1] = child.rewards[COLOURS.index(colour)]
+    finally:
+        stats.release()
+    return mcts.playout.count
+
+class ParallelMCTS:
+    """
+    Runs root parallel searches on a pool of worker processes, or in this
+    process when there is only one worker.
+    """
+
+    def __init__(self, workers=None, seed=None, iterations=2000):
+        """
+        :param workers: the number of processes, by default one per CPU
+        :param seed: seed for repeatable searches (which then run a fixed
+        number of iterations per worker)
+        :param iterations: the iterations per worker when seeded
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = max(1, workers)
+        self.seed = seed
+        self.iterations = iterations
+        self.playouts = 0
+
+        self._block = shared_memory.SharedMemory(create=True,
+            size=8 * _ROW * self.workers)
+        self._pool = None
+        if self.workers > 1:
+            self._pool = multiprocessing.Pool(self.workers)
+        # the pool and block go with the search, even if close() is never
+        # called (the referee has no way to say a game is over).
+        self._finalizer = weakref.finalize(self, ParallelMCTS._release,
+            self._pool, self._block)
+
+    @staticmethod
+    def _release(pool, block):
+        if pool is not None:
+            pool.terminate()
+        _attached.pop(block.name, None)
+        block.close()
+        block.unlink()
+
+    def close(self):
+        self._finalizer()
+
+    def search(self, board, nturns, seconds):
+        """
+        Searches a position on every worker and merges the results.
+
+        :param seconds: how long each worker searches for (ignored when
+        seeded)
+        :return: (move, visits), the most visited (then most rewarded) move,
+        None for a pass, and the visits of every root move, in the order of
+        the moves
+        """
+        colour = COLOURS[nturns % 3]
+        moves = Search._ordered_moves(board, colour)
+        codes = [move.encode() for move in moves] or [-1]
+
+        iterations = self.iterations if self.seed is not None else 0
+        tasks = []
+        for row in range(self.workers):
+            seed = None
+            if self.seed is not None:
+                seed = f"{self.seed}:{nturns}:{row}"
+            tasks.append((row, board.as_dict(), dict(board._win_state),
+                nturns, codes, seed, seconds, iterations, self._block.name))
+
+        if self._pool is None:
+            self.playouts += sum(search_root(task) for task in tasks)
+        else:
+            self.playouts += sum(self._pool.map(search_root, tasks))
+
+        # add up the rows in worker order.
+        stats = self._block.buf.cast("d")
+        try:
+            visits = [0.0] * len(codes)
+            rewards = [0.0] * len(codes)
+            for row in range(self.workers):
+                start = row * _ROW
+                for i in range(len(codes)):
+                    visits[i] += stats[start + i * _FIELDS]
+                    rewards[i] += stats[start + i * _FIELDS + 1]
+        finally:
+            stats.release()
+        # ties on visits go to the move that did best for the player.
+        best = max(range(len(codes)),
+            key=lambda i: (visits[i], rewards[i], -i))
+        return (moves[best] if moves else None), visits
+
+class Player:
+    """
+    The referee's interface to the parallel search.
+    """
+
+    def __init__(self, colour, workers=None, seed=None, time_limit=60.0,
+            report=True):
+        """
+        :param colour: "red", "green" or "blue"
+        :param workers: the number of processes, by default one per CPU
+        :param seed: seed for repeatable games
+        :param time_limit: the referee's CPU time limit for the game (its -t
+        option), 0 for none
+        :param report: print search statistics to stderr after every action
+        """
+        self.timer = TimeManager(time_limit)
+        with self.timer:
+            self.colour = NAMES[colour]
+            self.board = Board(Board.starting_board_dict())
+            self.nturns = 0
+            self.search = ParallelMCTS(workers, seed)
+            self.report = report
+
+    def action(self):
+        with self.timer:
+            n_moves = len(self.board.possible_moves(self.colour))
+            if n_moves <= 1:
+                moves = self.board.possible_moves(self.colour)
+                return to_action(moves[0] if moves else None)
+            # the workers' time is not counted against us, but plan as if it
+            # was, to keep the game moving.
+            budget = self.timer.plan(self.board, self.colour, self.nturns,
+                n_moves)
+            start = time.time()
+            playouts = self.search.playouts
+            move, visits = self.search.search(self.board, self.nturns,
+                budget.soft)
+            if self.report:
+                playouts = self.search.playouts - playouts
+                elapsed = time.time() - start
+                print(f"* parallel mcts ({self.colour}): {playouts} playouts "
+                    f"on {self.search.workers} workers in {elapsed:.3f}s "
+                    f"({playouts / max(elapsed, 1e-9):.0f}/s), "
+                    f"{int(sum(visits))} visits at the root", file=sys.stderr)
+            return to_action(move)
+
+    def update(self, colour, action):
+        with self.timer:
+            move = from_action(NAMES[colour], action)
+            if move is not None:
+                self.board.apply(move)
+            self.nturns += 1
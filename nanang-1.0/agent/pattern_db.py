@@ -0,0 +1,176 @@
+"""
+Pattern databases for the single player puzzles.
+
+For a given colour and block layout, this works out the exact number of moves
+needed to get every placement of one or two pieces off the board, by running a
+breadth first search backwards from the empty board. The tables are then
+combined into a heuristic for the whole puzzle:
+
+* one or two pieces left: the exact table is the true distance.
+* three or more pieces left: the pieces are split into pairs (and a single, if
+  there is an odd number), and the tables of the parts are added up. Each move
+  only ever moves one piece, so this is admissible as long as the parts ignore
+  each other, which is why these sums use a relaxed table where a jump is
+  allowed over any hex (a piece from another part could be there). The best
+  split is the one with the largest sum.
+
+The tables only depend on the colour and the blocks, so they are written to a
+small binary file the first time they are built and memory mapped afterwards.
+"""
+import os
+import math
+import mmap
+from collections import deque
+
+from game.move import EXITS, HEX_INDEX as INDEX, OFF, CODES as SIZE
+from game.packed import NEIGHBOUR_INDEX, JUMP_INDEX
+from agent import storage
+
+# the value stored for placements that can never be solved.
+UNSOLVABLE = 255
+
+_MAGIC = b"NPDB\x01"
+_TABLE = SIZE * SIZE
+
+def default_cache_dir():
+    """The directory the databases are stored in (see agent.storage)."""
+    return os.path.join(storage.cache_dir(), "pdb")
+
+def _steps(a, b, blocked, free_jumps):
+    """
+    Lists the hexes the piece at a can move or jump to, with its partner at b.
+    Moves and jumps can always be undone, so these are its predecessors too.
+    """
+    steps = []
+    for x in NEIGHBOUR_INDEX[a]:
+        if x != b and x not in blocked:
+            steps.append(x)
+    for x, mid in JUMP_INDEX[a]:
+        if (x != b and x not in blocked
+                and (free_jumps or mid == b or mid in blocked)):
+            steps.append(x)
+    return steps
+
+def build_table(blocked, exits, free_jumps):
+    """
+    Runs the retrograde breadth first search over every placement of two
+    pieces, starting from the solved (empty) board.
+
+    :param blocked: set of the indices of the blocks
+    :param exits: array of the indices of the unblocked exit hexes
+    :param free_jumps: allow jumps over any hex, rather than only over blocks
+        and the other piece
+    :return: bytearray of SIZE * SIZE distances, indexed by a * SIZE + b
+        where a and b are hex numbers (see game.move.HEX_INDEX), or OFF for
+        a piece that has already exited
+    """
+    table = bytearray([UNSOLVABLE]) * _TABLE
+    table[OFF * SIZE + OFF] = 0
+    queue = deque([(OFF, OFF)])
+
+    while len(queue) > 0:
+        a, b = queue.popleft()
+        cost = table[a * SIZE + b] + 1
+        preds = []
+        for mover, other, swap in ((a, b, False), (b, a, True)):
+            if mover == OFF:
+                # the piece has just exited, so it was sitting on an exit.
+                before = [x for x in exits if x != other]
+            else:
+                before = _steps(mover, other, blocked, free_jumps)
+            for x in before:
+                preds.append((other, x) if swap else (x, other))
+
+        for x, y in preds:
+            if table[x * SIZE + y] == UNSOLVABLE:
+                table[x * SIZE + y] = cost
+                queue.append((x, y))
+
+    return table
+
+class PatternDatabase:
+    """
+    The exact and relaxed two piece tables for one colour and block layout.
+    """
+
+    def __init__(self, exact, relaxed):
+        # both tables can be bytes-like objects or memory maps.
+        self._exact = exact
+        self._relaxed = relaxed
+
+    @staticmethod
+    def build(color, blocks):
+        blocked = {INDEX[x] for x in blocks}
+        exits = [INDEX[x] for x in EXITS[color] if INDEX[x] not in blocked]
+        return PatternDatabase(build_table(blocked, exits, False),
+            build_table(blocked, exits, True))
+
+    @staticmethod
+    def load(color, blocks, cache_dir=None):
+        """
+        Returns the database of a puzzle, memory mapping it from the cache if
+        it has been built before, and building and saving it otherwise.
+        """
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        mask = 0
+        for x in blocks:
+            mask |= 1 << INDEX[x]
+        path = os.path.join(cache_dir, f"{color}-{mask:010x}.pdb")
+
+        if not os.path.exists(path):
+            pdb = PatternDatabase.build(color, blocks)
+            os.makedirs(cache_dir, exist_ok=True)
+            with storage.atomic_write(path) as f:
+                f.write(_MAGIC)
+                f.write(pdb._exact)
+                f.write(pdb._relaxed)
+
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if data[:len(_MAGIC)] != _MAGIC or len(data) != len(_MAGIC) + 2*_TABLE:
+            raise ValueError(f"{path} is not a pattern database")
+        start = len(_MAGIC)
+        return PatternDatabase(memoryview(data)[start:start + _TABLE],
+            memoryview(data)[start + _TABLE:])
+
+    def evaluate(self, pieces):
+        """
+        Evaluates the heuristic for the pieces left on the board.
+
+        :param pieces: array of the coordinates of the pieces
+        :return: lower bound on the moves needed, math.inf if the pieces can
+            never all exit
+        """
+        idx = [INDEX[x] for x in pieces]
+        if len(idx) == 0:
+            return 0
+        elif len(idx) == 1:
+            value = self._exact[idx[0] * SIZE + OFF]
+        elif len(idx) == 2:
+            value = self._exact[idx[0] * SIZE + idx[1]]
+        else:
+            value = self._split(idx)
+
+        if value >= UNSOLVABLE:
+            return math.inf
+        return value
+
+    def _split(self, idx):
+        # finds the largest sum over the ways of pairing up the pieces.
+        table = self._relaxed
+        if len(idx) == 1:
+            return table[idx[0] * SIZE + OFF]
+        elif len(idx) == 2:
+            return table[idx[0] * SIZE + idx[1]]
+
+        first, rest = idx[0], idx[1:]
+        best = 0
+        for i, other in enumerate(rest):
+            value = (table[first * SIZE + other]
+                + self._split(rest[:i] + rest[i+1:]))
+            best = max(best, value)
+        if len(idx) % 2 == 1:
+            # with an odd number of pieces the first can also be the single.
+            best = max(best, table[first * SIZE + OFF] + self._split(rest))
+        return best
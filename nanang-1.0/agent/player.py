@@ -1,6 +1,15 @@
 import math
-from queue import PriorityQueue
+import time
+from array import array
 import heapq as heap
+from collections import deque
+
+from game.bitboard import BitBoard
+from game.move import Move, NEIGHBOURS, JUMPS
+from agent.pattern_db import PatternDatabase
+from agent.structures import NodeStore, BucketQueue
+from agent import vectorised
+from game import packed
 
 class Player:
     """
@@ -20,28 +29,72 @@ class Player:
         return 1
 
     @staticmethod
-    def _dist(x, y):
+    def _exit_costs(blocks, goals, free_jumps):
         """
-        calculates euclidian distance between two points
-        :param x: first coordinate
-        :param y: second coordinate
-        :return: hex manhattan distance
+        Runs a breadth first search outwards from the (unblocked) goal hexes
+        to find the number of moves a piece needs to get off the board from
+        every hex, exit move included.
 
-        formula taken from https://www.redblobgames.com/grids/hexagons/#distances
+        :param blocks: set of the coordinates of the blocks on the board
+        :param goals: array of the goal coordinates of the colour
+        :param free_jumps: if False, jumps are only allowed over blocks, which
+            is exact for a lone piece. If True, a jump may go over any hex,
+            since another piece could be sitting there, which keeps the costs
+            a lower bound when there is more than one piece.
+        :return: dictionary of the cost from each of the 37 hexes, math.inf
+            for the ones that can never reach a goal
         """
-        
-        return max(x[0]-y[0], x[1]-y[1], (-x[0]-x[1])-(-y[0]-y[1]))
+        costs = {cell: math.inf for cell in Move.BOARD_RANGE}
+        queue = deque()
+        for goal in goals:
+            if goal not in blocks:
+                costs[goal] = 1
+                queue.append(goal)
+
+        # every move and jump can be undone, so searching outwards from the
+        # goals finds the same distances as searching towards them.
+        while len(queue) > 0:
+            cell = queue.popleft()
+            cost = costs[cell] + 1
+            for nxt in NEIGHBOURS[cell]:
+                if nxt not in blocks and cost < costs[nxt]:
+                    costs[nxt] = cost
+                    queue.append(nxt)
+            for nxt, mid in JUMPS[cell]:
+                if (nxt not in blocks and (free_jumps or mid in blocks)
+                        and cost < costs[nxt]):
+                    costs[nxt] = cost
+                    queue.append(nxt)
+
+        return costs
 
-    def __init__(self, board, color, single=True):
+    def __init__(self, board, color, single=True, use_pdb=False):
         assert(board is not None and color in {"R", "G", "B"})
         self.start = board
         self.color = color
         self.n_pieces = len(board.pieces_of(color))
+        # the number of states the last search expanded.
+        self.expanded = 0
+        # how much longer than optimal the last anytime path can be.
+        self.bound = math.inf
         
         # Do extra initialization steps if it is a single_player game/
         if single:
-            self._goals = list(filter(lambda x: board._dict_rep[x] != 'X',
-                Player.GOALS[self.color]))
+            contents = board.as_dict()
+            self._blocks = {x for x in contents if contents[x] == 'X'}
+            self._blocked = packed.pack(self._blocks)
+            self._exit_mask = packed.EXIT_MASK[self.color]
+
+            # the block layout never changes, so the heuristic can be worked
+            # out for every hex once and then just looked up.
+            self._exit_cost = Player._exit_costs(self._blocks,
+                Player.GOALS[self.color], self.n_pieces > 1)
+
+            # the pattern database is a lot stronger on heavily blocked boards,
+            # but costs a (cached) build the first time a layout is seen.
+            self._pdb = None
+            if use_pdb:
+                self._pdb = PatternDatabase.load(self.color, self._blocks)
 
     #pseudo-code for A*, define methods inside board
     def find_path(self):
@@ -49,98 +102,396 @@ class Player:
         Attempts to find a path from the state stored in current.start, to any
         possible goal states.
 
+        The search runs on packed states (see game.packed) and keeps its
+        closed set and parent links in a NodeStore, so each visited state only
+        costs a dict entry and a few array slots. The path is rebuilt by
+        decoding the stored moves. The heuristic is integer valued, so the
+        open list is a BucketQueue, which also breaks ties on f towards the
+        deepest states.
+
         original A* sourcecode: https://www.redblobgames.com/pathfinding/a-star/introduction.html
-        :return: an array of the moves needed for all tiles to exit the board
+        :return: an array of the moves needed for all tiles to exit the board,
+        or None if that is impossible
         """
 
-        frontier = [(0, self.start)]
-        came_from = dict()
-        came_from[self.start] = None
-        cost_so_far = dict()
-        cost_so_far[self.start] = 0
+        nodes = NodeStore()
+        root = nodes.add(packed.pack(self.start.pieces_of(self.color)), 0)
+        frontier = BucketQueue()
+        frontier.push(0, 0, root)
+        self.expanded = 0
 
         while len(frontier) > 0:
             #explore the state that has a the highest priority
-            current = heap.heappop(frontier)[1]
+            _, cost, current = frontier.pop()
+            if nodes.g[current] != cost:
+                #a cheaper way here was found after this entry was pushed
+                continue
+            state = nodes.state[current]
 
-            #checks if the state is the goal state
-            if self.is_goal(current):
-                break
+            #checks if the state is the goal state (no pieces left)
+            if state == 0:
+                return [Move.decode(self.color, code)
+                    for code in nodes.path(current)]
+            self.expanded += 1
 
             #explores all possible moves that can be made from the current board state
-            for next_move in current.possible_moves(self.color):
+            for code, child in packed.successors(state, self._blocked,
+                    self._exit_mask):
 
                 #calculate the cost so far after the next possible move
-                new_cost = cost_so_far[current] + Player._cost(next_move)
-                next_board = current.possible_board(next_move)
+                new_cost = cost + Player._cost(code)
+                node = nodes.find(child)
 
                 #evaluate board state
-                if next_board not in cost_so_far or new_cost < cost_so_far[next_board]:
-                    cost_so_far[next_board] = new_cost
-                    priority = new_cost + self.evaluate_board(next_board)
-                    heap.heappush(frontier, (priority, next_board))
-                    came_from[next_board] = (next_move, current)
+                if node is None or new_cost < nodes.g[node]:
+                    heuristic = self._evaluate_pieces(packed.unpack(child))
+                    if heuristic == math.inf:
+                        #a piece got stuck where it can never exit
+                        continue
+                    if node is None:
+                        node = nodes.add(child, new_cost, current, code)
+                    else:
+                        nodes.relink(node, new_cost, current, code)
+                    frontier.push(new_cost + heuristic, new_cost, node)
 
-        return self.construct_path(came_from, current)
-    
-    def is_goal(self, current):
+        #ran out of states without ever reaching a goal
+        return None
+
+    def find_path_ida(self, table_size=100000):
         """
-        Checks if the state passed in current is a goal state.
+        Finds the same optimal path as find_path with iterative deepening A*.
+        Each iteration is a depth first search that cuts off at a bound on
+        g + h, walking the tree on a single board with apply/undo, so memory
+        only grows with the length of the path (plus a small transposition
+        table). The next bound is the smallest f that went over the last one.
+
+        :param table_size: the most states the transposition table will hold
+        in each iteration
+        :return: an array of the moves needed for all tiles to exit the board,
+        or None if that is impossible
         """
-        return (len(current.pieces_of(self.color)) == 0)
+        board = BitBoard(self.start.as_dict())
+        path = []
+        on_path = {hash(board)}
+        bound = self.evaluate_board(board)
+        self.expanded = 0
+
+        while bound != math.inf:
+            #the table only holds costs for the current bound
+            seen = dict()
+            found, bound = self._ida_search(board, 0, bound, path, on_path,
+                seen, table_size)
+            if found:
+                return path
+        return None
 
-    def construct_path(self, came_from, came_to):
+    def _ida_search(self, board, cost, bound, path, on_path, seen, table_size):
         """
-        A helper method to construct a path from the starting point to the
-        goal state that has already been found.
+        One depth first search of IDA*. Returns whether a goal was found (with
+        its moves left in path) and the smallest f that went over the bound.
         """
-        mv, current = (None, came_to)
-        path = []
-        moves = []
-
-        #trace back through the dictionary and recreate the path
-        while current != self.start:
-            path.append(current)
-            if mv is not None:
-                moves.append(mv)
-            mv, current = came_from[current]
-
-        path.reverse()
-        moves.append(mv)
-        moves.reverse()
-        return moves
+        f = cost + self.evaluate_board(board)
+        if f > bound:
+            return False, f
+        if self.is_goal(board):
+            return True, f
+
+        #if this state was already searched at a lower cost with this bound,
+        #everything below it has been searched too
+        key = hash(board)
+        if seen.get(key, math.inf) <= cost:
+            return False, math.inf
+        if len(seen) < table_size:
+            seen[key] = cost
+        self.expanded += 1
+
+        minimum = math.inf
+        for next_move in board.possible_moves(self.color):
+            token = board.apply(next_move)
+            child = hash(board)
+            if child not in on_path:
+                on_path.add(child)
+                path.append(next_move)
+                found, t = self._ida_search(board, cost +
+                    Player._cost(next_move), bound, path, on_path, seen,
+                    table_size)
+                on_path.discard(child)
+                if found:
+                    board.undo(token)
+                    return True, t
+                path.pop()
+                minimum = min(minimum, t)
+            board.undo(token)
+
+        return False, minimum
     
+    def find_path_anytime(self, time_limit, weight=3.0, step=0.5):
+        """
+        Anytime repairing A* (ARA*). Starts with a weighted A* search (f = g +
+        weight * h) that finds a path quickly, then keeps lowering the weight
+        and repairing the search, reusing every g-cost found so far, until the
+        path is optimal or the CPU time runs out. The best path found is
+        returned either way, with self.bound set to how much longer than
+        optimal it can be (1.0 once it is proven optimal).
+
+        :param time_limit: seconds of CPU time (as the referee counts it) the
+        search may use
+        :param weight: the heuristic weight of the first search
+        :param step: how much the weight drops after each search
+        :return: an array of the moves needed for all tiles to exit the board,
+        or None if no path was found in time
+        """
+        deadline = time.process_time() + time_limit
+        self.bound = math.inf
+        self.expanded = 0
+        start = packed.pack(self.start.pieces_of(self.color))
+        root_h = self._evaluate_pieces(packed.unpack(start))
+        if root_h == math.inf:
+            #some piece can never reach an exit
+            return None
+        nodes = NodeStore()
+        root = nodes.add(start, 0)
+        h = array("H", [root_h])
+        goal = None
+        best = None
+
+        #states waiting to be expanded, and states that got cheaper after
+        #being expanded in the current search
+        open_set = {root}
+        incons = set()
+        counter = 0
+
+        while True:
+            #rebuild the open list for the new weight
+            open_set |= incons
+            incons = set()
+            frontier = []
+            for node in open_set:
+                counter += 1
+                heap.heappush(frontier, (nodes.g[node] + weight * h[node],
+                    counter, node))
+            closed = set()
+
+            while len(frontier) > 0:
+                if goal is not None and nodes.g[goal] <= frontier[0][0]:
+                    break
+                if self.expanded % 256 == 0 and time.process_time() > deadline:
+                    return best
+                _, _, current = heap.heappop(frontier)
+                if current in closed or current not in open_set:
+                    #stale entry, the node was pushed again since
+                    continue
+                open_set.discard(current)
+                closed.add(current)
+                self.expanded += 1
+                cost = nodes.g[current]
+
+                for code, child in packed.successors(nodes.state[current],
+                        self._blocked, self._exit_mask):
+                    new_cost = cost + Player._cost(code)
+                    node = nodes.find(child)
+                    if node is None:
+                        heuristic = self._evaluate_pieces(packed.unpack(child))
+                        if heuristic == math.inf:
+                            continue
+                        node = nodes.add(child, new_cost, current, code)
+                        h.append(heuristic)
+                        if child == 0:
+                            goal = node
+                    elif new_cost < nodes.g[node]:
+                        nodes.relink(node, new_cost, current, code)
+                    else:
+                        continue
+
+                    if node in closed:
+                        incons.add(node)
+                    else:
+                        open_set.add(node)
+                        counter += 1
+                        heap.heappush(frontier, (new_cost + weight * h[node],
+                            counter, node))
+
+            if goal is None:
+                #the whole reachable space was searched without a goal
+                return None
+            best = [Move.decode(self.color, code) for code in nodes.path(goal)]
+
+            #every unexpanded state bounds how short the optimal path can be
+            lowest = min((nodes.g[node] + h[node]
+                for node in open_set | incons), default=nodes.g[goal])
+            self.bound = min(weight, nodes.g[goal] / max(lowest, 1))
+            if self.bound <= 1 or time.process_time() > deadline:
+                self.bound = max(self.bound, 1.0)
+                return best
+            weight = max(1.0, weight - step)
+
+    def find_path_bidirectional(self):
+        """
+        Bidirectional heuristic search (MM). The goal of a puzzle is a single
+        state (the blocks with no pieces left), so besides the usual forward
+        search from the start, a second search runs backwards from the empty
+        board by undoing exits, moves and jumps. The backward heuristic adds
+        up, for every starting piece, the fewest moves to either exit or reach
+        one of the pieces of the backward state (at least one move per piece
+        still to put back).
+
+        Both sides order their states by max(g + h, 2g), which keeps either
+        side from running past the middle of the path, and each round expands
+        the side with the lowest such priority. Whenever a state is reached
+        from both sides, the combined cost is a path. The best one is returned
+        once no pair of open states could make a shorter one: its length is at
+        most the lowest priority, or the lowest g of each side plus one move.
+
+        :return: an array of the moves needed for all tiles to exit the board,
+        or None if that is impossible
+        """
+        start = packed.pack(self.start.pieces_of(self.color))
+        n = self.n_pieces
+
+        #each starting piece either ends up on one of the pieces of a backward
+        #state or exits, and has to make at least the moves to get there
+        tables = [(self._exit_cost[x], Player._exit_costs(self._blocks, [x],
+            n > 1)) for x in self.start.pieces_of(self.color)]
+        def backward(pieces):
+            total = 0
+            for exit_cost, costs in tables:
+                total += min([exit_cost] + [costs[x] - 1 for x in pieces])
+            return max(total, n - len(pieces))
+
+        #per side: the nodes, the open list, the heuristic, the g of every
+        #open node and the number of open nodes with each g
+        sides = []
+        for root, heuristic in ((start, self._evaluate_pieces),
+                (0, backward)):
+            h = heuristic(packed.unpack(root))
+            if h == math.inf:
+                #some piece can never reach an exit
+                return None
+            nodes = NodeStore()
+            frontier = BucketQueue()
+            node = nodes.add(root, 0)
+            frontier.push(h, 0, node)
+            sides.append((nodes, frontier, heuristic, {node: 0}, [1]))
+
+        best = math.inf
+        meet = None
+        self.expanded = 0
+
+        while True:
+            lowest = [side[1].min_f() for side in sides]
+            if min(lowest) == math.inf:
+                break
+            g_min = [next(g for g, count in enumerate(side[4]) if count > 0)
+                for side in sides]
+            if best <= max(min(lowest), g_min[0] + g_min[1] + 1):
+                break
+
+            forward = lowest[0] < lowest[1] or (lowest[0] == lowest[1]
+                and len(sides[0][3]) <= len(sides[1][3]))
+            nodes, frontier, heuristic, open_g, g_count = sides[
+                0 if forward else 1]
+            others = sides[1 if forward else 0][0]
+
+            _, cost, current = frontier.pop()
+            if open_g.get(current) != cost:
+                continue
+            del open_g[current]
+            g_count[cost] -= 1
+            self.expanded += 1
+
+            state = nodes.state[current]
+            if forward:
+                children = packed.successors(state, self._blocked,
+                    self._exit_mask)
+            else:
+                children = packed.predecessors(state, self._blocked,
+                    self._exit_mask, n)
+
+            for code, child in children:
+                new_cost = cost + Player._cost(code)
+                node = nodes.find(child)
+                if node is not None and new_cost >= nodes.g[node]:
+                    continue
+                h = heuristic(packed.unpack(child))
+                if h == math.inf:
+                    continue
+                if node is None:
+                    node = nodes.add(child, new_cost, current, code)
+                else:
+                    nodes.relink(node, new_cost, current, code)
+                    if node in open_g:
+                        g_count[open_g[node]] -= 1
+
+                open_g[node] = new_cost
+                while len(g_count) <= new_cost:
+                    g_count.append(0)
+                g_count[new_cost] += 1
+                frontier.push(max(new_cost + h, 2 * new_cost), new_cost, node)
+
+                #check whether the other side has been here too
+                other = others.find(child)
+                if other is not None and new_cost + others.g[other] < best:
+                    best = new_cost + others.g[other]
+                    meet = child
+
+        if meet is None:
+            return None
+
+        #the forward half is stored start first, the backward half stores each
+        #state's move towards the goal
+        forward_nodes, backward_nodes = sides[0][0], sides[1][0]
+        codes = forward_nodes.path(forward_nodes.find(meet))
+        node = backward_nodes.find(meet)
+        while backward_nodes.parent[node] != NodeStore.ROOT:
+            codes.append(backward_nodes.move[node])
+            node = backward_nodes.parent[node]
+        return [Move.decode(self.color, code) for code in codes]
+
+    def is_goal(self, current):
+        """
+        Checks if the state passed in current is a goal state.
+        """
+        return current.count_of(self.color) == 0
+
     def evaluate_board(self, board):
         """
         Evaluates the heuristic score of a new board (not the starting board). 
         See the report for details about the evaluation function being
         implemented here.
 
-        This evaluation function is to be used with the A* pathfinding.
+        This evaluation function is to be used with the A* pathfinding. It adds
+        up the precomputed exit cost of every remaining piece, which is never
+        more than the true number of moves left, or asks the pattern database
+        if there is one.
 
-        :param pieces: array of the coordinates of pieces on the board
-        :param goals: array of the coordinates of goals (relevant to piece(s)) on the board
-        :return: sum of minimum distances
+        :param board: the board to evaluate
+        :return: sum of the exit costs of the pieces, math.inf if any piece
+            can never exit
         """
 
-        pieces = board.pieces_of(self.color)
-        goals = self._goals
+        return self._evaluate_pieces(board.pieces_of(self.color))
+
+    def evaluate_boards(self, boards):
+        """
+        Evaluates the heuristic score of many boards at once, with NumPy if it
+        is installed and there is no pattern database to ask instead.
+
+        :param boards: list of the boards to evaluate
+        :return: list of the same scores as evaluate_board gives
+        """
+        if self._pdb is None and vectorised.AVAILABLE:
+            cells, _ = vectorised.encode(boards)
+            return vectorised.single_costs(cells, self.color,
+                self._exit_cost).tolist()
+        return [self.evaluate_board(board) for board in boards]
 
-        #probability of finding another piece on the board
-        prob_factor = (len(pieces) - 1) / 37
+    def _evaluate_pieces(self, pieces):
+        # the heuristic, for an array of the coordinates of the pieces.
+        if self._pdb is not None:
+            return self._pdb.evaluate(pieces)
 
-        #find the total sum of minimum distance(s) for the piece(s) to their goal tile(s)
-        totalMinimum = 0
+        exit_cost = self._exit_cost
+        total = 0
         for key in pieces:
-            minimum = 0
-            flag = True
-            for goal in goals:
-              heur = (4/7 * prob_factor + (1-prob_factor)) * (Player._dist(key, goal) + 1)
-              if flag:
-                minimum = heur
-                flag = False
-              elif heur<minimum:
-                minimum = heur
-            totalMinimum+=minimum
-
-        return totalMinimum
\ No newline at end of file
+            total += exit_cost[key]
+        return total
@@ -0,0 +1,105 @@
+"""
+A persistent cache of solved single player puzzles.
+
+Puzzles are stored under their canonical form (see agent.symmetry), so a
+puzzle that is a rotation or a mirror image of one solved before is a hit too.
+Its moves are mapped back onto the orientation that was asked for. The cache
+keeps the most recently used puzzles up to a fixed size, and is saved as a
+JSON file.
+"""
+import os
+import json
+from collections import OrderedDict
+
+from game.move import Move
+from agent import symmetry, storage
+
+class SolutionCache:
+
+    def __init__(self, path=None, capacity=10000):
+        """
+        :param path: the JSON file the cache is loaded from and saved to, or
+        None to only keep it in memory
+        :param capacity: the most puzzles kept, least recently used go first
+        """
+        self.path = path
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for key, moves in json.load(f):
+                    self._entries[key] = moves
+
+    @staticmethod
+    def key(colour, pieces, blocks):
+        """
+        Returns the key a puzzle is cached under, which is the same for all
+        of its symmetric variants.
+        """
+        return SolutionCache._canonical(colour, pieces, blocks)[0]
+
+    @staticmethod
+    def _canonical(colour, pieces, blocks):
+        # the key of a puzzle, and the transform that maps it onto the key.
+        pieces, blocks, perm = symmetry.canonicalise(colour, pieces, blocks)
+        return json.dumps([pieces, blocks]), perm
+
+    def get(self, colour, pieces, blocks):
+        """
+        Looks up the moves that solve a puzzle.
+
+        :return: an array of Moves for colour, or None if the puzzle (and all
+        of its symmetric variants) has not been seen
+        """
+        key, perm = SolutionCache._canonical(colour, pieces, blocks)
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        back = symmetry.inverse(perm)
+        return [Move(colour, symmetry.transform_cell(back, tuple(src)),
+                    symmetry.transform_cell(back, dst and tuple(dst)))
+                for src, dst in self._entries[key]]
+
+    def put(self, colour, pieces, blocks, moves):
+        """
+        Stores the moves that solve a puzzle, under its canonical form.
+        """
+        key, perm = SolutionCache._canonical(colour, pieces, blocks)
+        self._entries[key] = [(symmetry.transform_cell(perm, move.source),
+            symmetry.transform_cell(perm, move.dest)) for move in moves]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def solve(self, player, method="find_path"):
+        """
+        Returns the moves for a Player's puzzle from the cache, only running
+        the search (and caching the result) if it is not there.
+
+        :param method: the name of the Player search to run on a miss
+        """
+        pieces = player.start.pieces_of(player.color)
+        blocks = list(player._blocks)
+        moves = self.get(player.color, pieces, blocks)
+        if moves is None:
+            moves = getattr(player, method)()
+            if moves is not None:
+                self.put(player.color, pieces, blocks, moves)
+        return moves
+
+    def save(self):
+        """
+        Writes the cache to its file, oldest entries first.
+        """
+        if self.path is None:
+            return
+        with storage.atomic_write(self.path, "w") as f:
+            json.dump(list(self._entries.items()), f)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,30 @@
+"""
+Where the tables the agents build ahead of time (pattern databases, the
+opening book, the endgame tablebase) are kept, and how they are written.
+"""
+import os
+from contextlib import contextmanager
+
+def cache_dir():
+    """
+    The directory the tables are kept in, ~/.cache/nanang unless the
+    NANANG_CACHE environment variable names another one.
+    """
+    return os.environ.get("NANANG_CACHE",
+        os.path.join(os.path.expanduser("~"), ".cache", "nanang"))
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    """
+    Opens a file to be written in place of path. It is written under another
+    name and only renamed to path once it has been closed without an error,
+    so nobody can read (or memory map) a half written file.
+    """
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp, mode) as f:
+            yield f
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
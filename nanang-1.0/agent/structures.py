@@ -0,0 +1,132 @@
+"""
+Compact data structures for the searches in agent.player.
+"""
+import math
+from array import array
+
+class NodeStore:
+    """
+    The closed set and parent links of a search over packed states (see
+    game.packed), kept as a handful of arrays instead of a Board, dict entries
+    and a (Move, Board) tuple per state.
+
+    Every state gets a node id when it is first added. The id indexes the
+    state itself, its g-cost, its parent's id and the encoded move that got
+    there from the parent (see Move.encode), so a path can be read back by
+    following the parents and decoding the moves.
+    """
+    __slots__ = ("_ids", "state", "g", "parent", "move")
+
+    ROOT = -1
+
+    def __init__(self):
+        self._ids = dict()
+        self.state = array("Q")
+        self.g = array("H")
+        self.parent = array("l")
+        self.move = array("H")
+
+    def add(self, state, g, parent=ROOT, move=0):
+        # stores a new state and returns its node id.
+        node = len(self.state)
+        self._ids[state] = node
+        self.state.append(state)
+        self.g.append(g)
+        self.parent.append(parent)
+        self.move.append(move)
+        return node
+
+    def find(self, state):
+        # returns the node id of a state, or None if it has not been added.
+        return self._ids.get(state)
+
+    def relink(self, node, g, parent, move):
+        # records a cheaper way of reaching a node.
+        self.g[node] = g
+        self.parent[node] = parent
+        self.move[node] = move
+
+    def path(self, node):
+        """
+        Returns the encoded moves from the root to a node, in order.
+        """
+        moves = []
+        while self.parent[node] != NodeStore.ROOT:
+            moves.append(self.move[node])
+            node = self.parent[node]
+        moves.reverse()
+        return moves
+
+    def __len__(self):
+        return len(self.state)
+
+class BucketQueue:
+    """
+    An A* open list for integer priorities. Items are kept in one bucket per
+    f value, and inside that in one bucket per g value, so pushing and popping
+    are O(1) (amortised, while f never goes down, as it does with a consistent
+    heuristic) instead of O(log n) heap operations.
+
+    Ties on f are broken towards the highest g, which are the states closest to
+    a goal, and then towards the most recently pushed item, so the search
+    order is always the same.
+    """
+    __slots__ = ("_buckets", "_min_f", "_size")
+
+    def __init__(self):
+        # _buckets[f][g] is a stack of items. Empty g buckets are trimmed from
+        # the end of each list, so its last bucket always has the highest g.
+        self._buckets = []
+        self._min_f = 0
+        self._size = 0
+
+    def push(self, f, g, item):
+        if not math.isfinite(f):
+            raise ValueError(f"BucketQueue priorities must be finite, not {f}")
+        buckets = self._buckets
+        while len(buckets) <= f:
+            buckets.append([])
+        by_g = buckets[f]
+        while len(by_g) <= g:
+            by_g.append([])
+        by_g[g].append(item)
+        if f < self._min_f:
+            self._min_f = f
+        self._size += 1
+
+    def pop(self):
+        """
+        Removes and returns the (f, g, item) with the lowest f, breaking ties
+        as described above.
+        """
+        if self._size == 0:
+            raise IndexError("pop from an empty BucketQueue")
+        buckets = self._buckets
+        f = self._min_f
+        while not buckets[f]:
+            f += 1
+        self._min_f = f
+
+        by_g = buckets[f]
+        g = len(by_g) - 1
+        item = by_g[g].pop()
+        while by_g and not by_g[-1]:
+            by_g.pop()
+        self._size -= 1
+        return f, g, item
+
+    def min_f(self):
+        """
+        Returns the lowest f in the queue (math.inf if it is empty) without
+        removing anything.
+        """
+        if self._size == 0:
+            return math.inf
+        f = self._min_f
+        while not self._buckets[f]:
+            f += 1
+        self._min_f = f
+        return f
+
+    def __len__(self):
+        return self._size
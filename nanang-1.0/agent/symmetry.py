@@ -0,0 +1,54 @@
+"""
+Symmetries of the board that keep the goal edges as goal edges.
+
+In cube coordinates (q, r, s) with s = -q-r, red exits at q = 3, green at
+r = 3 and blue at s = 3. Shuffling the three coordinates around is a rotation
+(by a multiple of 120 degrees) or a reflection of the board, and it moves each
+of these edges onto another one, so it also swaps the colours around. That
+gives 6 symmetries, each written here as the permutation of (q, r, s) it
+applies.
+"""
+from itertools import permutations
+
+COLOURS = ["R", "G", "B"]
+
+TRANSFORMS = list(permutations(range(3)))
+
+IDENTITY = (0, 1, 2)
+
+def transform_cell(perm, cell):
+    # moves a cell (or None, for an exit) to where the symmetry puts it.
+    if cell is None:
+        return None
+    cube = (cell[0], cell[1], -cell[0]-cell[1])
+    return (cube[perm[0]], cube[perm[1]])
+
+def transform_colour(perm, colour):
+    # the colour whose goal edge the symmetry moves colour's goal edge onto.
+    return COLOURS[perm.index(COLOURS.index(colour))]
+
+def inverse(perm):
+    inv = [0, 0, 0]
+    for k, i in enumerate(perm):
+        inv[i] = k
+    return tuple(inv)
+
+def canonicalise(colour, pieces, blocks):
+    """
+    Maps a puzzle onto its canonical form: the symmetric variant played by red
+    with the smallest (sorted) piece and block coordinates. Every variant of
+    the same puzzle has the same canonical form.
+
+    :return: the canonical pieces and blocks, as sorted tuples, and the
+    symmetry that takes the puzzle there
+    """
+    best = None
+    for perm in TRANSFORMS:
+        if transform_colour(perm, colour) != "R":
+            continue
+        form = (tuple(sorted(transform_cell(perm, x) for x in pieces)),
+            tuple(sorted(transform_cell(perm, x) for x in blocks)))
+        if best is None or form < best[0]:
+            best = (form, perm)
+    (pieces, blocks), perm = best
+    return pieces, blocks, perm
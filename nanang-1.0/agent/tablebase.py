@@ -0,0 +1,296 @@
+"""
+An endgame tablebase for three player Chexers.
+
+Pieces only leave the board by exiting, so the pieces on the board always
+number the same as the exits the three colours still need between them, and
+the fewest a game can be played on with is three: every colour one exit from
+winning. There are few enough of those positions (the hexes and colours of
+the three pieces, and whose turn it is) to solve them all exactly, by
+retrograde analysis from the won positions:
+
+    python -m agent.tablebase
+
+A position's value is the paranoid outcome for red: WON if red can force a
+win whatever the other two do, LOST if green and blue together can force one
+of them to win, and DRAWN if neither can (so with best play nobody ever wins,
+and the game runs out of turns). The other colours use the same table by
+rotating the board so that they become red, which keeps the order of play
+(see agent.symmetry). Games are assumed to have no blocks, as three player
+games start without any.
+
+Values take 2 bits each and are indexed by a perfect hash of the position
+(a mixed radix number made of the turn, the colours and the rank of the set
+of hexes), so the whole table is about 150KB.
+"""
+import os
+import sys
+import mmap
+import argparse
+from array import array
+from collections import deque
+from itertools import combinations
+
+from game.move import Move, HEX_INDEX, EXITS, WIN_EXITS, MAX_TURNS
+from game.packed import NEIGHBOUR_INDEX, JUMP_INDEX
+from agent.symmetry import transform_cell, transform_colour
+from agent import storage
+
+COLOURS = ["R", "G", "B"]
+
+# the pieces (of all colours together) on the board in every position the
+# table covers.
+MAX_PIECES = 3
+
+# the values in the table.
+UNUSED, WON, LOST, DRAWN = range(4)
+
+# the rotation that makes each colour red, keeping the order of play.
+ROTATIONS = {"R": (0, 1, 2), "G": (1, 2, 0), "B": (2, 0, 1)}
+
+_MAGIC = b"NTB\x02"
+
+_HEXES = len(Move.BOARD_RANGE)
+_EXIT_INDEX = [frozenset(HEX_INDEX[x] for x in EXITS[colour])
+    for colour in COLOURS]
+
+# every set of hexes for the pieces, sorted, and its rank.
+_PLACEMENTS = list(combinations(range(_HEXES), MAX_PIECES))
+_PLACEMENT_INDEX = {cells: i for i, cells in enumerate(_PLACEMENTS)}
+_COLOURINGS = 3 ** MAX_PIECES
+SIZE = 3 * _COLOURINGS * len(_PLACEMENTS)
+
+def default_tablebase_path():
+    """Where the table is written and read by default (see agent.storage)."""
+    return os.path.join(storage.cache_dir(), "tablebase.bin")
+
+def index(turn, pieces):
+    """
+    The perfect hash of a position.
+
+    :param turn: the number of the colour to move (0, 1 or 2 for red, green
+    or blue)
+    :param pieces: list of MAX_PIECES (hex number, colour number) pairs,
+    sorted
+    """
+    cells = tuple(cell for cell, _ in pieces)
+    colouring = 0
+    for _, colour in pieces:
+        colouring = colouring * 3 + colour
+    return ((turn * _COLOURINGS + colouring) * len(_PLACEMENTS)
+        + _PLACEMENT_INDEX[cells])
+
+def position(node):
+    """The (turn, pieces) of a position, from its index."""
+    rest, rank = divmod(node, len(_PLACEMENTS))
+    turn, colouring = divmod(rest, _COLOURINGS)
+    colours = []
+    for _ in range(MAX_PIECES):
+        colouring, colour = divmod(colouring, 3)
+        colours.append(colour)
+    colours.reverse()
+    return turn, list(zip(_PLACEMENTS[rank], colours))
+
+def _moves(turn, pieces):
+    """
+    The moves of the colour to move in a position.
+
+    :return: (exits, children), whether it has an exit (which wins) and the
+    indices of the positions after every other move
+    """
+    following = (turn + 1) % 3
+    occupied = {cell for cell, _ in pieces}
+    exits = False
+    children = []
+    for k, (cell, colour) in enumerate(pieces):
+        if colour != turn:
+            continue
+        if cell in _EXIT_INDEX[turn]:
+            exits = True
+        rest = pieces[:k] + pieces[k+1:]
+        for dest in NEIGHBOUR_INDEX[cell]:
+            if dest not in occupied:
+                children.append(index(following,
+                    sorted(rest + [(dest, turn)])))
+        for dest, mid in JUMP_INDEX[cell]:
+            if dest not in occupied and mid in occupied:
+                # the piece jumped over is captured.
+                after = [(x, turn if x == mid else c) for x, c in rest]
+                children.append(index(following,
+                    sorted(after + [(dest, turn)])))
+    return exits, children
+
+def _parents(node):
+    """
+    The indices of the positions with a move (or a pass) that leads to a
+    position, found by taking back moves.
+    """
+    turn, pieces = position(node)
+    mover = (turn - 1) % 3
+    occupied = {cell: c for cell, c in pieces}
+    parents = []
+    for k, (cell, colour) in enumerate(pieces):
+        if colour != mover:
+            continue
+        rest = pieces[:k] + pieces[k+1:]
+        for src in NEIGHBOUR_INDEX[cell]:
+            if src not in occupied:
+                parents.append(index(mover, sorted(rest + [(src, mover)])))
+        for src, mid in JUMP_INDEX[cell]:
+            if src not in occupied and occupied.get(mid) == mover:
+                # the piece jumped over may have been captured from anyone.
+                for was in range(3):
+                    before = [(x, was if x == mid else c) for x, c in rest]
+                    parents.append(index(mover,
+                        sorted(before + [(src, mover)])))
+    before = index(mover, pieces)
+    exits, children = _moves(mover, pieces)
+    if not exits and len(children) == 0:
+        #the mover had to pass
+        parents.append(before)
+    return parents
+
+def _solve(side, moves):
+    """
+    Finds every position the given side can force a win from: the side's
+    positions need an exit or one child found, the others need no exit and
+    all their children found.
+
+    :param side: True to solve for red (WON), False for green and blue (LOST)
+    :param moves: array of the number of moves (a pass counts as one) of
+    every position, -1 for those with an exit
+    :return: bytearray, 1 for the positions found
+    """
+    found = bytearray(SIZE)
+    left = array("l", moves)
+    queue = deque()
+    for node in range(SIZE):
+        # (the other side's positions with an exit can never be found, as
+        # they start with -1 moves left)
+        mine = (node // (_COLOURINGS * len(_PLACEMENTS)) == 0) == side
+        if mine and moves[node] < 0:
+            found[node] = 1
+            queue.append(node)
+
+    while len(queue) > 0:
+        node = queue.popleft()
+        for parent in _parents(node):
+            if found[parent]:
+                continue
+            if (parent // (_COLOURINGS * len(_PLACEMENTS)) == 0) == side:
+                found[parent] = 1
+                queue.append(parent)
+            elif left[parent] > 0:
+                left[parent] -= 1
+                if left[parent] == 0:
+                    found[parent] = 1
+                    queue.append(parent)
+    return found
+
+def build():
+    """
+    Solves every position with MAX_PIECES pieces.
+
+    :return: bytearray of SIZE values, WON, LOST or DRAWN
+    """
+    moves = array("l", [0]) * SIZE
+    for node in range(SIZE):
+        exits, children = _moves(*position(node))
+        moves[node] = -1 if exits else max(1, len(children))
+
+    won = _solve(True, moves)
+    lost = _solve(False, moves)
+    values = bytearray(SIZE)
+    for node in range(SIZE):
+        values[node] = WON if won[node] else LOST if lost[node] else DRAWN
+    return values
+
+def pack(values):
+    # packs the values four to a byte.
+    packed = bytearray((len(values) + 3) // 4)
+    for i, value in enumerate(values):
+        packed[i >> 2] |= value << ((i & 3) * 2)
+    return packed
+
+class Tablebase:
+    """
+    The solved table, read from the file agent.tablebase writes.
+    """
+
+    def __init__(self, packed):
+        self._packed = packed
+
+    @staticmethod
+    def load(path=None):
+        if path is None:
+            path = default_tablebase_path()
+        with open(path, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (data[:len(_MAGIC)] != _MAGIC
+                or len(data) != len(_MAGIC) + (SIZE + 3) // 4):
+            raise ValueError(f"{path} is not a tablebase")
+        return Tablebase(memoryview(data)[len(_MAGIC):])
+
+    @staticmethod
+    def write(path, values):
+        with storage.atomic_write(path) as f:
+            f.write(_MAGIC)
+            f.write(pack(values))
+
+    def value(self, node):
+        return (self._packed[node >> 2] >> ((node & 3) * 2)) & 3
+
+    def probe(self, board, nturns, hero):
+        """
+        Looks up the exact outcome of a position for one colour.
+
+        :param nturns: the number of turns played to reach the board
+        :param hero: the colour the outcome is for
+        :return: WON, LOST or DRAWN, or None if the position is not one the
+        table covers, or is close enough to the turn limit that running out
+        of turns could change the outcome
+        """
+        total = 0
+        for colour in COLOURS:
+            if board.exits_of(colour) != WIN_EXITS - 1:
+                return None
+            total += board.count_of(colour)
+        if total != MAX_PIECES:
+            return None
+        if any(board.controller_at(x) == "X" for x in Move.BOARD_RANGE):
+            return None
+        if nturns > 3 * MAX_TURNS - 30 * MAX_PIECES:
+            return None
+
+        perm = ROTATIONS[hero]
+        pieces = []
+        for colour in COLOURS:
+            c = COLOURS.index(transform_colour(perm, colour))
+            for cell in board.pieces_of(colour):
+                pieces.append((HEX_INDEX[transform_cell(perm, cell)], c))
+        pieces.sort()
+        turn = COLOURS.index(transform_colour(perm, COLOURS[nturns % 3]))
+        return self.value(index(turn, pieces))
+
+def get_options():
+    """Parse and return command-line arguments."""
+    parser = argparse.ArgumentParser(prog="agent.tablebase",
+        description="builds the endgame tablebase for three player Chexers.")
+    parser.add_argument("-o", "--output", default=None,
+        help="file to write the table to (default: "
+            f"{default_tablebase_path()})")
+    return parser.parse_args()
+
+def main():
+    options = get_options()
+    path = options.output
+    if path is None:
+        path = default_tablebase_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    values = build()
+    Tablebase.write(path, values)
+    counts = [values.count(v) for v in (WON, LOST, DRAWN)]
+    print(f"wrote {sum(counts)} positions to {path} ({counts[0]} won, "
+        f"{counts[1]} lost, {counts[2]} drawn for red)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Time management for agents playing under the referee's CPU time limit.
+
+The referee adds up the CPU time a player spends in __init__, action and
+update, and ends the game as soon as the total goes over its limit (the -t
+option, 60 seconds in the tournament). A TimeManager keeps the same count
+from the inside, and splits what is left over the moves the agent still
+expects to make, so that it neither runs out of time in a long game nor
+wastes it on positions where there is nothing to think about.
+"""
+import time
+
+from game.move import EXIT_DISTANCE, MAX_TURNS, WIN_EXITS
+
+# how much longer one iteration of a deepening search usually takes than the
+# one before it.
+GROWTH = 4.0
+
+class MoveBudget:
+    """
+    The time one search may spend: it aims to finish by the soft limit, and
+    may keep going up to the hard limit when extended, but never further.
+    """
+
+    def __init__(self, soft, hard):
+        """
+        :param soft: seconds of CPU time the search aims to use
+        :param hard: seconds of CPU time the search must stop by
+        """
+        self.start = time.process_time()
+        self.soft = min(soft, hard)
+        self.hard = hard
+        # the process_time at which the search has to give up.
+        self.deadline = self.start + hard
+
+    def elapsed(self):
+        return time.process_time() - self.start
+
+    def should_deepen(self, last_iteration):
+        """
+        Says whether there is time for another iteration of a deepening
+        search, given how long the last one took.
+        """
+        return self.elapsed() + GROWTH * last_iteration <= self.soft
+
+    def extend(self, factor=2.0):
+        """
+        Gives the search more time (up to the hard limit), for when its best
+        move keeps changing and the answer is not settled yet.
+        """
+        self.soft = min(self.soft * factor, self.hard)
+
+class TimeManager:
+    """
+    Counts the CPU time used by an agent and plans how much each move gets.
+    Wrap the bodies of the agent's __init__, action and update in a with
+    block on the manager, so that it sees the same time as the referee.
+    """
+
+    def __init__(self, time_limit=60.0, reserve=0.05, min_reserve=0.5,
+            hard_factor=3.0, unlimited_move=0.5):
+        """
+        :param time_limit: CPU time (seconds) for the whole game, 0 for none
+        :param reserve: fraction of the limit that is never planned for, to
+        cover the time the referee counts against us outside our own code
+        :param min_reserve: the smallest reserve, in seconds
+        :param hard_factor: how far past its share a move may be extended
+        :param unlimited_move: the share of a move when there is no limit
+        """
+        self.limit = time_limit
+        self.reserve = max(min_reserve, reserve * time_limit)
+        self.hard_factor = hard_factor
+        self.unlimited_move = unlimited_move
+        self.used = 0.0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.used += time.process_time() - self._start
+        self._start = None
+
+    def remaining(self):
+        """
+        Returns the CPU time left to plan with, not counting the reserve.
+        """
+        spent = self.used
+        if self._start is not None:
+            # count the time of a with block that is still open too.
+            spent += time.process_time() - self._start
+        return max(0.0, self.limit - self.reserve - spent)
+
+    @staticmethod
+    def moves_left(board, colour, nturns):
+        """
+        Estimates how many more moves a colour will make: enough to walk the
+        pieces it needs off the board (or to capture for the ones it is
+        missing), with some slack, but never past the turn limit.
+
+        :param nturns: the number of turns played in the game so far (by all
+        the players)
+        """
+        needed = WIN_EXITS - board.exits_of(colour)
+        distances = sorted(EXIT_DISTANCE[colour][x]
+            for x in board.pieces_of(colour))
+        estimate = sum(distances[:needed])
+        estimate += 4 * max(0, needed - len(distances))
+        cap = MAX_TURNS - nturns // 3
+        return max(1, min(cap, int(1.25 * estimate) + 4))
+
+    def plan(self, board, colour, nturns, n_moves):
+        """
+        Works out the budget for one move.
+
+        :param n_moves: the number of legal moves, as there is nothing to
+        decide if there are fewer than two
+        :return: a MoveBudget, started now
+        """
+        if n_moves <= 1:
+            return MoveBudget(0.0, 0.0)
+        if not self.limit:
+            return MoveBudget(self.unlimited_move,
+                self.unlimited_move * self.hard_factor)
+
+        remaining = self.remaining()
+        share = remaining / self.moves_left(board, colour, nturns)
+        # never let one move use up more than a quarter of what is left.
+        hard = min(share * self.hard_factor, remaining / 4)
+        return MoveBudget(share, hard)
@@ -0,0 +1,133 @@
+"""
+A fixed size transposition table for the game tree searches in
+agent.multiplayer.
+
+The same position is reached over and over through different orders of the
+same moves. The table remembers what a search found out about each position
+(how deep it looked, the value or bound it got and the best move), so that a
+later visit can cut off straight away or at least try the best move first.
+
+Entries are kept in preallocated arrays rather than a dict of objects, so the
+table never grows past the number of bytes it is given, which keeps it within
+the referee's memory limit (its -s option). The arrays are split into buckets
+of two slots: the first keeps the deepest result (deep searches are the most
+expensive to redo), the second always takes the newest one.
+"""
+from array import array
+
+# the kinds of value an entry can hold. EMPTY slots hold nothing, and ORDER
+# entries only hold a best move, for searches whose values can't be reused.
+EMPTY, EXACT, LOWER, UPPER, ORDER = range(5)
+
+# the move stored when there is no best move.
+NO_MOVE = 0xFFFF
+
+class TranspositionTable:
+    """
+    Maps position keys (see game.zobrist.position_key) to search results.
+
+    probe() returns the slot of a key, which indexes the public depth, flag,
+    value and move arrays, and store() writes a result. Keys are stored in
+    full, so two positions only mix up if their 64-bit keys are equal; keys
+    that merely land in the same bucket are counted as collisions.
+    """
+    __slots__ = ("_mask", "_generation", "keys", "depth", "flag", "value",
+        "move", "age", "hits", "misses", "collisions")
+
+    # key, value, move, depth, flag and age.
+    ENTRY_BYTES = 8 + 8 + 2 + 1 + 1 + 1
+
+    def __init__(self, byte_budget=8 * 1024 * 1024):
+        """
+        :param byte_budget: the most memory (in bytes) the entries may use,
+        which is rounded down to a power of two buckets
+        """
+        buckets = 1
+        while 2 * buckets * 2 * TranspositionTable.ENTRY_BYTES <= byte_budget:
+            buckets *= 2
+        self._mask = buckets - 1
+        self._generation = 0
+
+        # repeating a one item array allocates the whole array in one go,
+        # without building a list or bytes object of the same size first.
+        size = 2 * buckets
+        self.keys = array("Q", [0]) * size
+        self.value = array("d", [0.0]) * size
+        self.move = array("H", [NO_MOVE]) * size
+        self.depth = array("b", [0]) * size
+        self.flag = array("B", [EMPTY]) * size
+        self.age = array("B", [0]) * size
+
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def new_search(self):
+        """
+        Marks the entries stored so far as old, so that they give way to the
+        results of the next search even if they are deeper.
+        """
+        self._generation = (self._generation + 1) % 256
+
+    def probe(self, key):
+        # returns the slot holding key, or -1 if it is not in the table.
+        slot = (key & self._mask) * 2
+        for i in (slot, slot + 1):
+            if self.flag[i] != EMPTY and self.keys[i] == key:
+                self.hits += 1
+                return i
+        self.misses += 1
+        return -1
+
+    def store(self, key, depth, flag, value, move=NO_MOVE):
+        """
+        Records a search result, replacing the entry of the same key if there
+        is one. Otherwise it goes in the depth-preferred slot if it is at least
+        as deep as what is there (or what is there is from an old search),
+        and in the always-replace slot if not.
+
+        :param depth: how many plies below the position were searched
+        :param flag: EXACT, LOWER or UPPER for a value that is exact, a lower
+        bound or an upper bound, or ORDER for just a best move
+        :param move: the encoded best move (see Move.encode), or NO_MOVE
+        """
+        slot = (key & self._mask) * 2
+        if self.flag[slot + 1] != EMPTY and self.keys[slot + 1] == key:
+            slot += 1
+        elif not (self.flag[slot] == EMPTY or self.keys[slot] == key
+                or depth >= self.depth[slot]
+                or self.age[slot] != self._generation):
+            slot += 1
+        if self.flag[slot] != EMPTY and self.keys[slot] != key:
+            self.collisions += 1
+            if slot % 2 == 0:
+                # the deep entry being pushed out is still worth more than
+                # whatever is in the always-replace slot.
+                self._copy(slot, slot + 1)
+
+        self.keys[slot] = key
+        self.depth[slot] = min(depth, 127)
+        self.flag[slot] = flag
+        self.value[slot] = value
+        self.move[slot] = move
+        self.age[slot] = self._generation
+
+    def _copy(self, src, dest):
+        self.keys[dest] = self.keys[src]
+        self.depth[dest] = self.depth[src]
+        self.flag[dest] = self.flag[src]
+        self.value[dest] = self.value[src]
+        self.move[dest] = self.move[src]
+        self.age[dest] = self.age[src]
+
+    def clear(self):
+        self.flag[:] = array("B", [EMPTY]) * len(self.flag)
+        self.hits = self.misses = self.collisions = 0
+
+    def nbytes(self):
+        # the memory used by the entries.
+        return len(self.keys) * TranspositionTable.ENTRY_BYTES
+
+    def __len__(self):
+        # the number of slots, used or not.
+        return len(self.keys)
@@ -0,0 +1,138 @@
+"""
+Evaluates many boards at once with NumPy.
+
+Boards are encoded as rows of an N x 37 int8 array, one column per hex (in
+game.move.HEX_INDEX order) holding EMPTY, BLOCK or the number of the colour
+on it (1 for red, 2 for green, 3 for blue), with an N x 3 array of the exit
+counts next to it. The evaluations here work on whole arrays of those, so
+that a search can score every child of a node in a single call, and give
+exactly the same numbers as the one-board-at-a-time versions:
+
+* single_costs is Player.evaluate_board without a pattern database.
+* scores is agent.multiplayer.default_evaluation, for all three colours.
+
+NumPy is optional: importing this module works without it, and AVAILABLE
+says whether the functions can be used. It is also only imported the first
+time one of them runs (or load is called), as it takes several times the
+memory of the rest of the agent, which counts against the limits that
+agent.batch and the referee put on the process.
+"""
+import importlib.util
+
+from game.move import Move, HEX_INDEX, JUMP_MID, EXIT_DISTANCE, WIN_EXITS
+
+AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+COLOURS = ["R", "G", "B"]
+EMPTY, BLOCK = 0, 4
+CODES = {"R": 1, "G": 2, "B": 3, "X": BLOCK}
+_CODE_OF = {None: EMPTY, **CODES}
+
+# a distance larger than any on the board, for hexes without a piece.
+_FAR = 99
+
+def load():
+    """
+    Imports NumPy and sets up the tables the functions here use, if that
+    hasn't been done yet.
+    """
+    global np, _DISTANCE, _COLOUR_CODES, _COLUMNS
+    if np is not None:
+        return
+    if not AVAILABLE:
+        raise ImportError("agent.vectorised needs numpy (pip install numpy)")
+    import numpy
+    # _DISTANCE[c] is the exit distance of every hex for colour c + 1.
+    _DISTANCE = numpy.array([[EXIT_DISTANCE[colour][x]
+        for x in Move.BOARD_RANGE] for colour in COLOURS], dtype=numpy.int16)
+    _COLOUR_CODES = numpy.array([[1], [2], [3]], dtype=numpy.int8)
+    _COLUMNS = numpy.arange(WIN_EXITS)
+    np = numpy
+
+def encode(boards):
+    """
+    Encodes a list of Boards.
+
+    :return: (cells, exits), an N x 37 int8 array and an N x 3 int16 array
+    """
+    load()
+    cells = np.array([[_CODE_OF[board.controller_at(x)]
+        for x in Move.BOARD_RANGE] for board in boards],
+        dtype=np.int8).reshape(-1, len(HEX_INDEX))
+    exits = np.array([[board.exits_of(colour) for colour in COLOURS]
+        for board in boards], dtype=np.int16).reshape(-1, 3)
+    return cells, exits
+
+def expand(board, moves):
+    """
+    Encodes the boards after each of a list of moves of one colour on a
+    board, without making any of them: the board is encoded once and the
+    moves are written into copies of it all together.
+
+    :return: (cells, exits) as for encode, one row per move
+    """
+    load()
+    cells, exits = encode([board])
+    n = len(moves)
+    cells = np.repeat(cells, n, axis=0)
+    exits = np.repeat(exits, n, axis=0)
+    if n == 0:
+        return cells, exits
+
+    code = CODES[moves[0].controller]
+    rows = np.arange(n)
+    src = np.array([HEX_INDEX[m.source] for m in moves])
+    dest = np.array([-1 if m.dest is None else HEX_INDEX[m.dest]
+        for m in moves])
+    mid = np.array([HEX_INDEX.get(JUMP_MID.get((m.source, m.dest)), -1)
+        for m in moves])
+
+    cells[rows, src] = EMPTY
+    moved = dest >= 0
+    cells[rows[moved], dest[moved]] = code
+    exits[rows[~moved], code - 1] += 1
+    # a piece of another colour jumped over is captured.
+    jumped = mid >= 0
+    owner = np.full(n, EMPTY, dtype=np.int8)
+    owner[jumped] = cells[rows[jumped], mid[jumped]]
+    captured = jumped & (owner != EMPTY) & (owner != code) & (owner != BLOCK)
+    cells[rows[captured], mid[captured]] = code
+    return cells, exits
+
+def single_costs(cells, colour, exit_cost):
+    """
+    The single player heuristic (the sum of the exit costs of the pieces of
+    a colour) of every row.
+
+    :param exit_cost: the exit cost of every hex, as in Player._exit_cost
+    :return: array of N floats, math.inf where a piece can never exit
+    """
+    load()
+    costs = np.array([exit_cost[x] for x in Move.BOARD_RANGE],
+        dtype=np.float64)
+    mine = cells == CODES[colour]
+    # inf * 0 is nan, so only add up the hexes with pieces on them.
+    return np.where(mine, costs, 0.0).sum(axis=1)
+
+def scores(cells, exits):
+    """
+    The default multiplayer evaluation of every row, for every colour.
+
+    :return: N x 3 array of floats, the score of each colour in COLOURS order
+    """
+    load()
+    # the pieces of each colour, N x 3 x 37.
+    mine = cells[:, None, :] == _COLOUR_CODES
+    count = mine.sum(axis=2)
+    needed = WIN_EXITS - exits
+    # only the WIN_EXITS closest pieces of a colour can be needed.
+    distances = np.where(mine, _DISTANCE, _FAR)
+    closest = np.sort(distances, axis=2)[:, :, :WIN_EXITS]
+    used = (_COLUMNS < needed[:, :, None]) & (closest < _FAR)
+
+    result = 100.0 * exits
+    result += np.where(used, 30.0 - 4.0 * closest, 0.0).sum(axis=2)
+    result += 5.0 * np.maximum(0, count - needed)
+    result -= 60.0 * np.maximum(0, needed - count)
+    return result
@@ -0,0 +1,231 @@
+"""
+A bitboard representation of the board, with the same interface as
+game.board.Board, so that any of the searches can be run on either.
+
+Every controller ('R', 'G', 'B' and the blocks 'X') gets its own integer mask
+with bit i set for a piece on hex i (numbered by game.move.HEX_INDEX, as in
+game.packed). Finding the moves is then testing bits of the occupied mask
+instead of looking hexes up in a dict, and every Move a colour can ever make
+is built once at import time, so possible_moves allocates nothing but the
+list. apply/undo only change the masks (and the zobrist key) of the colours
+involved, and possible_board copies four ints rather than 37 hexes.
+"""
+from game.move import Move, HEX_INDEX, EXITS, JUMP_MID, CODES
+from game.board import Board
+from game.packed import NEIGHBOUR_INDEX, JUMP_INDEX, pack, unpack
+from game import zobrist
+
+_CONTROLLERS = ("R", "G", "B", "X")
+_HEXES = len(Move.BOARD_RANGE)
+
+# every move of each colour from each hex: (destination bit, Move) pairs for
+# steps, (destination bit, midpoint bit, Move) for jumps, and the exit (or
+# None where the colour can't exit).
+_STEPS = {}
+_JUMPS = {}
+_EXIT = {}
+for _c in ("R", "G", "B"):
+  _STEPS[_c] = [[(1 << d, Move(_c, cell, Move.BOARD_RANGE[d]))
+    for d in NEIGHBOUR_INDEX[i]] for i, cell in enumerate(Move.BOARD_RANGE)]
+  _JUMPS[_c] = [[(1 << d, 1 << m, Move(_c, cell, Move.BOARD_RANGE[d]))
+    for d, m in JUMP_INDEX[i]] for i, cell in enumerate(Move.BOARD_RANGE)]
+  _EXIT[_c] = [Move(_c, cell, None) if cell in EXITS[_c] else None
+    for cell in Move.BOARD_RANGE]
+
+# the hex jumped over by each encoded move (see Move.encode), -1 for steps
+# and exits.
+_MID = [-1] * (_HEXES * CODES)
+for (_src, _dst), _mid in JUMP_MID.items():
+  _MID[HEX_INDEX[_src] * CODES + HEX_INDEX[_dst]] = HEX_INDEX[_mid]
+
+# the zobrist key of each controller on each hex.
+_KEYS = {c: [zobrist.KEYS[(cell, c)] for cell in Move.BOARD_RANGE]
+  for c in _CONTROLLERS}
+
+class BitBoard:
+  empty_board_dict = staticmethod(Board.empty_board_dict)
+  from_json = staticmethod(Board.from_json)
+  starting_board_dict = staticmethod(Board.starting_board_dict)
+
+  def __init__(self, board_dict, winner_dict=None, debug=False):
+    # Packs a dictionary representation (see Board) into the masks.
+    self._masks = {c: pack(x for x, controller in board_dict.items()
+      if controller == c) for c in _CONTROLLERS}
+    self._key = zobrist.board_key(board_dict)
+    if winner_dict is None:
+      winner_dict = {"R": 0, "G": 0, "B": 0}
+    self._win_state = winner_dict
+    self.debug = debug
+
+  def _occupied(self):
+    masks = self._masks
+    return masks["R"] | masks["G"] | masks["B"] | masks["X"]
+
+  def possible_moves(self, controller, pieces_pos=None):
+    pieces = self._masks[controller]
+    if pieces_pos is not None:
+      #if a piece list is supplied, take their word for it
+      pieces = pack(pieces_pos)
+
+    occupied = self._occupied()
+    steps = _STEPS[controller]
+    jumps = _JUMPS[controller]
+    exits = _EXIT[controller]
+    moves = []
+    while pieces:
+      low = pieces & -pieces
+      pieces ^= low
+      src = low.bit_length() - 1
+      for dest, move in steps[src]:
+        if not occupied & dest:
+          moves.append(move)
+      for dest, mid, move in jumps[src]:
+        if not occupied & dest and occupied & mid:
+          moves.append(move)
+      if exits[src] is not None:
+        moves.append(exits[src])
+
+    return moves
+
+  def pieces_of(self, controller):
+    assert(controller in ["R", "G", "B"])
+    return unpack(self._masks[controller])
+
+  def count_of(self, controller):
+    """
+    Returns the number of pieces a controller still has on the board.
+    """
+    return bin(self._masks[controller]).count("1")
+
+  def exits_of(self, controller):
+    """
+    Returns the number of pieces a controller has exited so far.
+    """
+    return self._win_state[controller]
+
+  def controller_at(self, cell):
+    """
+    Returns the controller of the piece on a hex, or None if it is empty.
+    """
+    bit = 1 << HEX_INDEX[cell]
+    for controller, mask in self._masks.items():
+      if mask & bit:
+        return controller
+    return None
+
+  def valid_move(self, move):
+    """
+    Checks if a move is valid
+    """
+    if not self._masks[move.controller] & (1 << HEX_INDEX[move.source]):
+      return False
+    if move._exitable():
+      return True
+    occupied = self._occupied()
+    if occupied & (1 << HEX_INDEX[move.dest]):
+      return False
+    if move._adjacent():
+      return True
+    elif move._jumpable():
+      mid = JUMP_MID[(move.source, move.dest)]
+      return bool(occupied & (1 << HEX_INDEX[mid]))
+    return False
+
+  def make_move(self, move):
+    """
+      Alters the state of the board, as if we have performed the move described
+      in the argument move.
+    """
+    if (self.valid_move(move)):
+      self.apply(move)
+      print(str(move))
+      return True
+    return False
+
+  def possible_board(self, move):
+    """
+      Returns a board state after as if we performed this move. Only the masks
+      are copied, so this is a lot cheaper than it is for Board.
+    """
+    assert(self.valid_move(move))
+    board = BitBoard.__new__(BitBoard)
+    board._masks = self._masks.copy()
+    board._key = self._key
+    board._win_state = self._win_state.copy()
+    board.debug = self.debug
+    board.apply(move)
+    return board
+
+  def apply(self, move):
+    """
+      Performs the move on this board in place and returns an undo token, as
+      Board.apply does. The move is assumed to be valid.
+    """
+    masks = self._masks
+    controller = move.controller
+    keys = _KEYS[controller]
+    before = masks[controller]
+    src = HEX_INDEX[move.source]
+    own = before ^ (1 << src)
+    key = self._key ^ keys[src]
+    captured = None
+    if move.dest is not None:
+      dst = HEX_INDEX[move.dest]
+      own |= 1 << dst
+      key ^= keys[dst]
+
+      # jumping over another colour's piece captures it.
+      mid = _MID[src * CODES + dst]
+      if mid >= 0:
+        bit = 1 << mid
+        if not own & bit:
+          for owner in ("R", "G", "B"):
+            if masks[owner] & bit:
+              captured = (owner, masks[owner])
+              masks[owner] ^= bit
+              own |= bit
+              key ^= _KEYS[owner][mid] ^ keys[mid]
+              break
+    else:
+      self._win_state[controller] += 1
+
+    masks[controller] = own
+    token = (controller, before, captured, self._key, move.dest is None)
+    self._key = key
+    return token
+
+  def undo(self, token):
+    """
+      Reverts the move that returned this token. Tokens have to be undone in
+      the reverse order that they were applied in.
+    """
+    controller, before, captured, key, exited = token
+    self._masks[controller] = before
+    if captured is not None:
+      owner, mask = captured
+      self._masks[owner] = mask
+    if exited:
+      self._win_state[controller] -= 1
+    self._key = key
+
+  def __eq__(self, other):
+    return self._key == other._key and self._masks == other._masks
+
+  def __str__(self):
+    return Board._stringify_board(self, debug=self.debug)
+
+  def __hash__(self):
+    return self._key
+
+  def as_dict(self):
+    """
+    Returns the dictionary representation of the board.
+    """
+    board_dict = Board.empty_board_dict()
+    for controller, mask in self._masks.items():
+      for cell in unpack(mask):
+        board_dict[cell] = controller
+    return board_dict
+
+  def __lt__(self, other):
+    return False
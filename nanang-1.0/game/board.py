@@ -8,7 +8,15 @@ A piece has a 'controller' and a 'position', the 'controller' is the team that
 controls a piece, which is a selection of 'R', 'G', 'B', 'X'. ('X' refers to the
 blocking pieces.)
 """
-from game.move import Move
+from game.move import Move, NEIGHBOURS, JUMPS, JUMP_MID, EXITS
+from game import zobrist
+
+# where every colour starts a (three player) game.
+STARTING_HEXES = {
+  "R": [(-3, 3), (-3, 2), (-3, 1), (-3, 0)],
+  "G": [(0, -3), (1, -3), (2, -3), (3, -3)],
+  "B": [(3, 0), (2, 1), (1, 2), (0, 3)],
+}
 
 class Board:
   @staticmethod
@@ -47,13 +55,44 @@ class Board:
 
       return board_dict
     else:
-      # Note that we have not yet implemented the multiplayer version of the
-      # game.
-      raise NotImplementedError
+      # the multiplayer version has a list of pieces for every colour (by
+      # name), and maybe some blocks.
+      board_dict = Board.empty_board_dict()
+      for name, spots in ref_dict.items():
+        controller = "X" if name == "blocks" else name[0].upper()
+        for spot in spots:
+          key = (spot[0], spot[1])
+          if (key in board_dict):
+            board_dict[key] = controller
+          else:
+            raise IndexError
+
+      return board_dict
 
-  def __init__(self, board_dict, winner_dict=None, debug=False):
+  @staticmethod
+  def starting_board_dict():
+    # creates the board dictionary of the start of a three player game.
+    return Board.from_json({"red": STARTING_HEXES["R"],
+      "green": STARTING_HEXES["G"], "blue": STARTING_HEXES["B"]},
+      single=False)
+
+  def __init__(self, board_dict, winner_dict=None, debug=False, key=None,
+    pieces=None):
     # The dictionary representation of the board.
     self._dict_rep = board_dict
+    # The positions of the pieces of each colour, kept up to date by every
+    # move so that nothing has to scan the whole board to find them.
+    if pieces is None:
+      pieces = {"R": set(), "G": set(), "B": set()}
+      for cell, controller in board_dict.items():
+        if controller in pieces:
+          pieces[controller].add(cell)
+    self._pieces = pieces
+    # The zobrist key of the board, only computed from scratch if the caller
+    # does not already know it.
+    if key is None:
+      key = zobrist.board_key(board_dict)
+    self._key = key
     if winner_dict is None:
       winner_dict = {"R": 0, "G": 0, "B": 0}
     self._win_state = winner_dict
@@ -74,27 +113,44 @@ class Board:
       #if a piece list is supplied, take their word for it
       pieces_pos = self.pieces_of(controller)
 
+    # only geometrically legal moves are ever built, so this never needs to
+    # catch anything or filter the result afterwards.
+    board = self._dict_rep
+    exits = EXITS[controller]
     moves = []
     for pos in pieces_pos:
-      moves.extend([Move(controller, pos, x) for x in   \
-        map(lambda i: (pos[0] + i[0], pos[1] + i[1]), 
-        Move.DELTAS_JUMP + Move.DELTAS_MOVE) if Move._in_board(x)])
-      
-      try:
-        # really hackish way to consider the exit moves, may change later.
+      for dest in NEIGHBOURS[pos]:
+        if board[dest] is None:
+          moves.append(Move(controller, pos, dest))
+      for dest, mid in JUMPS[pos]:
+        if board[dest] is None and board[mid] is not None:
+          moves.append(Move(controller, pos, dest))
+      if pos in exits:
         moves.append(Move(controller, pos, None))
-      except AssertionError:
-        pass
     
-    return list(filter(lambda move: self.valid_move(move), moves))
+    return moves
 
   def pieces_of(self, controller):
     assert(controller in ["R", "G", "B"])
-    pieces = []
-    for key in self._dict_rep:
-      if self._dict_rep[key] == controller:
-        pieces.append(key)
-    return pieces
+    return list(self._pieces[controller])
+
+  def count_of(self, controller):
+    """
+    Returns the number of pieces a controller still has on the board.
+    """
+    return len(self._pieces[controller])
+
+  def exits_of(self, controller):
+    """
+    Returns the number of pieces a controller has exited so far.
+    """
+    return self._win_state[controller]
+
+  def controller_at(self, cell):
+    """
+    Returns the controller of the piece on a hex, or None if it is empty.
+    """
+    return self._dict_rep[cell]
 
   def valid_move(self, move):
     """
@@ -120,6 +176,8 @@ class Board:
       new_board = self.possible_board(move)
       self._dict_rep = new_board._dict_rep
       self._win_state = new_board._win_state
+      self._key = new_board._key
+      self._pieces = new_board._pieces
       print(str(move))
       return True
     return False
@@ -138,14 +196,94 @@ class Board:
     src = move.source
     new_dict = self._dict_rep.copy()
     new_winners = self._win_state.copy()
+    controller = new_dict[src]
+    new_key = self._key ^ zobrist.KEYS[(src, controller)]
+    new_pieces = {c: cells.copy() for c, cells in self._pieces.items()}
+    new_pieces[controller].discard(src)
 
     if dst is not None:
-      new_dict[dst] = new_dict[src]
+      new_dict[dst] = controller
       new_dict[src] = None
+      new_key ^= zobrist.KEYS[(dst, controller)]
+      new_pieces[controller].add(dst)
+
+      # jumping over another colour's piece captures it.
+      mid = JUMP_MID.get((src, dst))
+      if mid is not None:
+        owner = new_dict[mid]
+        if owner != controller and owner in new_pieces:
+          new_dict[mid] = controller
+          new_key ^= (zobrist.KEYS[(mid, owner)]
+            ^ zobrist.KEYS[(mid, controller)])
+          new_pieces[owner].discard(mid)
+          new_pieces[controller].add(mid)
     else:
       new_dict[src] = None
+      new_winners[controller] += 1
       
-    return Board(new_dict, winner_dict=new_winners, debug=self.debug)
+    return Board(new_dict, winner_dict=new_winners, debug=self.debug,
+      key=new_key, pieces=new_pieces)
+
+  def apply(self, move):
+    """
+      Performs the move on this board in place, without allocating a new board,
+      and returns an undo token. Passing the token to undo() puts the board
+      back exactly how it was, so a depth-first search can walk the whole tree
+      on a single board. The move is assumed to be valid.
+    """
+    dst = move.dest
+    src = move.source
+    board = self._dict_rep
+    controller = board[src]
+    captured = None
+
+    board[src] = None
+    key = self._key ^ zobrist.KEYS[(src, controller)]
+    pieces = self._pieces[controller]
+    pieces.discard(src)
+    if dst is not None:
+      board[dst] = controller
+      key ^= zobrist.KEYS[(dst, controller)]
+      pieces.add(dst)
+
+      # jumping over another colour's piece captures it.
+      mid = JUMP_MID.get((src, dst))
+      if mid is not None:
+        owner = board[mid]
+        if owner != controller and owner in self._pieces:
+          captured = (mid, owner)
+          board[mid] = controller
+          key ^= zobrist.KEYS[(mid, owner)] ^ zobrist.KEYS[(mid, controller)]
+          self._pieces[owner].discard(mid)
+          pieces.add(mid)
+    else:
+      self._win_state[controller] += 1
+
+    token = (src, dst, controller, self._key, captured)
+    self._key = key
+    return token
+
+  def undo(self, token):
+    """
+      Reverts the move that returned this token. Tokens have to be undone in
+      the reverse order that they were applied in.
+    """
+    src, dst, controller, key, captured = token
+    board = self._dict_rep
+    pieces = self._pieces[controller]
+    if captured is not None:
+      mid, owner = captured
+      board[mid] = owner
+      pieces.discard(mid)
+      self._pieces[owner].add(mid)
+    board[src] = controller
+    pieces.add(src)
+    if dst is not None:
+      board[dst] = None
+      pieces.discard(dst)
+    else:
+      self._win_state[controller] -= 1
+    self._key = key
 
   def __eq__(self, other):
     """
@@ -155,13 +293,15 @@ class Board:
       Note: this overloads the == operator, allowing you to write board1 == board2
       to make a call to this method. Fuck Java for not having this.
     """
-    return self._dict_rep == other._dict_rep
+    # different keys can never be equal boards, and comparing two ints is a
+    # lot cheaper than comparing two dicts.
+    return self._key == other._key and self._dict_rep == other._dict_rep
 
   def __str__(self):
     return self._stringify_board(debug=self.debug)
 
   def __hash__(self):
-    return hash(tuple(sorted(self._dict_rep.items())))
+    return self._key
 
   def _stringify_board(self, message="", debug=False):
     # Adapted from the sample code given
@@ -225,9 +365,10 @@ class Board:
     # prepare the provided board contents as strings, formatted to size.
     ran = range(-3, +3+1)
     cells = []
+    contents = self.as_dict()
     for qr in [(q,r) for q in ran for r in ran if -q-r in ran]:
-        if qr in self._dict_rep:
-            cell = str(self._dict_rep[qr]).center(5)
+        if qr in contents:
+            cell = str(contents[qr]).center(5)
         else:
             cell = "     " # 5 spaces will fill a cell
         cells.append(cell)
@@ -236,11 +377,11 @@ class Board:
     board = template.format(message, *cells)
     return board
   
-  def as_dict(self, other):
+  def as_dict(self):
     """
     Returns the dictionary representation of the board.
     """
-    return dict(self._dict_rep.entries())
+    return self._dict_rep.copy()
 
   def __lt__(self, other):
     return False
\ No newline at end of file
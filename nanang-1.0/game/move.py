@@ -12,7 +12,7 @@ class Move:
 
   @staticmethod
   def _in_board(point):
-    return point in Move.BOARD_RANGE
+    return point in _BOARD_SET
 
   def __init__(self, controller, source, dest):
     self.source = source
@@ -26,12 +26,7 @@ class Move:
 
   def _exitable(self):
     if (self.dest == None):
-      if self.controller == "R":
-        return self.source[0] == 3
-      elif self.controller == "G":
-        return self.source[1] == 3
-      elif self.controller == "B":
-        return self.source in [(0,-3), (-1, -2), (-2, -1), (-3, 0)]
+      return self.source in EXITS.get(self.controller, ())
     return False
 
   def _adjacent(self):
@@ -55,4 +50,60 @@ class Move:
       return f"# something went wrong"
 
   def __hash__(self):
-    return hash((self.controller, self.source, self.dest))
\ No newline at end of file
+    return hash((self.controller, self.source, self.dest))
+
+  def encode(self):
+    """
+    Packs the move into a small int (the controller is left out), see
+    Move.decode for the way back.
+    """
+    dest = OFF if self.dest is None else HEX_INDEX[self.dest]
+    return HEX_INDEX[self.source] * CODES + dest
+
+  @staticmethod
+  def decode(controller, code):
+    src, dest = divmod(code, CODES)
+    return Move(controller, Move.BOARD_RANGE[src],
+      None if dest == OFF else Move.BOARD_RANGE[dest])
+
+# The geometry index of the board, built once at import time so that move
+# generation never has to do any coordinate arithmetic or bounds checks.
+_BOARD_SET = frozenset(Move.BOARD_RANGE)
+
+# every hex is numbered by its place in Move.BOARD_RANGE, with one extra number
+# standing for off the board. Encoded moves are src * CODES + dest.
+HEX_INDEX = {cell: i for i, cell in enumerate(Move.BOARD_RANGE)}
+OFF = len(Move.BOARD_RANGE)
+CODES = OFF + 1
+
+# the hexes that are a single step away from each hex.
+NEIGHBOURS = {}
+# (destination, midpoint) pairs of each jump that can be made from each hex.
+JUMPS = {}
+
+for _q, _r in Move.BOARD_RANGE:
+  NEIGHBOURS[(_q, _r)] = [(_q + dq, _r + dr) for dq, dr in Move.DELTAS_MOVE
+    if (_q + dq, _r + dr) in _BOARD_SET]
+  JUMPS[(_q, _r)] = [((_q + 2*dq, _r + 2*dr), (_q + dq, _r + dr))
+    for dq, dr in Move.DELTAS_MOVE if (_q + 2*dq, _r + 2*dr) in _BOARD_SET]
+
+# the hex jumped over by each (source, destination) jump.
+JUMP_MID = {(src, dest): mid for src in JUMPS for dest, mid in JUMPS[src]}
+
+# the hexes each colour can exit the board from.
+EXITS = {
+  "R": frozenset(x for x in Move.BOARD_RANGE if x[0] == 3),
+  "G": frozenset(x for x in Move.BOARD_RANGE if x[1] == 3),
+  "B": frozenset(x for x in Move.BOARD_RANGE if -x[0]-x[1] == 3),
+}
+
+# the moves needed to walk a piece on each hex off the board, exit included.
+EXIT_DISTANCE = {
+  "R": {x: 4 - x[0] for x in Move.BOARD_RANGE},
+  "G": {x: 4 - x[1] for x in Move.BOARD_RANGE},
+  "B": {x: 4 + x[0] + x[1] for x in Move.BOARD_RANGE},
+}
+
+# the rules of the three player game, as in referee.game.
+WIN_EXITS = 4
+MAX_TURNS = 256 # per player
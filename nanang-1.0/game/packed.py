@@ -0,0 +1,86 @@
+"""
+Packed single player states.
+
+In a single player puzzle the blocks never move, so all a search needs to know
+about a state is which hexes the player's pieces are on. That is packed into
+an int with bit i set for a piece on hex i (numbered by game.move.HEX_INDEX),
+which is far smaller than a Board, hashes for free and can be stored in an
+array.
+"""
+from game.move import Move, HEX_INDEX, NEIGHBOURS, JUMPS, EXITS, OFF, CODES
+
+# the neighbour and jump tables of game.move, in hex numbers.
+NEIGHBOUR_INDEX = [[HEX_INDEX[x] for x in NEIGHBOURS[cell]]
+  for cell in Move.BOARD_RANGE]
+JUMP_INDEX = [[(HEX_INDEX[x], HEX_INDEX[mid]) for x, mid in JUMPS[cell]]
+  for cell in Move.BOARD_RANGE]
+
+EXIT_MASK = {colour: sum(1 << HEX_INDEX[x] for x in cells)
+  for colour, cells in EXITS.items()}
+
+def pack(cells):
+  # packs a list of coordinates into a mask.
+  mask = 0
+  for cell in cells:
+    mask |= 1 << HEX_INDEX[cell]
+  return mask
+
+def unpack(mask):
+  # lists the coordinates of the hexes in a mask.
+  cells = []
+  while mask:
+    low = mask & -mask
+    cells.append(Move.BOARD_RANGE[low.bit_length() - 1])
+    mask ^= low
+  return cells
+
+def successors(mask, blocked, exits):
+  """
+  Generates every move of the pieces in mask, the packed equivalent of
+  Board.possible_moves followed by Board.possible_board.
+
+  :param mask: the packed pieces of the player
+  :param blocked: the packed blocks
+  :param exits: the packed exit hexes of the player (see EXIT_MASK)
+  :return: array of (encoded move, packed state after the move) pairs
+  """
+  occupied = mask | blocked
+  children = []
+  pieces = mask
+  while pieces:
+    low = pieces & -pieces
+    pieces ^= low
+    src = low.bit_length() - 1
+    rest = mask ^ low
+    for dest in NEIGHBOUR_INDEX[src]:
+      if not (occupied >> dest) & 1:
+        children.append((src * CODES + dest, rest | (1 << dest)))
+    for dest, mid in JUMP_INDEX[src]:
+      if not (occupied >> dest) & 1 and (occupied >> mid) & 1:
+        children.append((src * CODES + dest, rest | (1 << dest)))
+    if exits & low:
+      children.append((src * CODES + OFF, rest))
+  return children
+
+def predecessors(mask, blocked, exits, limit):
+  """
+  Generates every state the pieces in mask could have just come from, for
+  searching backwards from the goal. Moves and jumps can always be undone,
+  and an exited piece came off one of the empty exit hexes (unless there are
+  already limit pieces on the board).
+
+  :return: array of (encoded move from the earlier state, earlier state)
+  pairs
+  """
+  parents = []
+  for code, before in successors(mask, blocked, 0):
+    src, dest = divmod(code, CODES)
+    parents.append((dest * CODES + src, before))
+
+  if bin(mask).count("1") < limit:
+    free = exits & ~(mask | blocked)
+    while free:
+      low = free & -free
+      free ^= low
+      parents.append(((low.bit_length() - 1) * CODES + OFF, mask | low))
+  return parents
@@ -0,0 +1,40 @@
+"""
+Zobrist keys for board positions.
+
+Every (hex, controller) pair gets a random 64-bit number, and the key of a
+board is the xor of the numbers of everything on it. Moving a piece is then
+just two xors, so boards can keep their key up to date in O(1) instead of
+rehashing all 37 hexes.
+
+The generator is seeded, so keys are the same from one run to the next and
+can be written to disk.
+"""
+import random
+
+from game.move import Move
+
+_rng = random.Random(30024)
+
+KEYS = {(cell, controller): _rng.getrandbits(64)
+  for cell in Move.BOARD_RANGE for controller in ("R", "G", "B", "X")}
+
+def board_key(board_dict):
+  # computes the key of a dictionary representation from scratch.
+  key = 0
+  for cell, controller in board_dict.items():
+    if controller is not None:
+      key ^= KEYS[(cell, controller)]
+  return key
+
+# a board key leaves out whose turn it is and how many pieces each colour has
+# exited, which a game tree search has to tell apart.
+TURN_KEYS = {colour: _rng.getrandbits(64) for colour in ("R", "G", "B")}
+EXIT_KEYS = {(colour, n): _rng.getrandbits(64)
+  for colour in ("R", "G", "B") for n in range(13)}
+
+def position_key(board, turn):
+  # the key of a board with the colour turn to move.
+  key = board._key ^ TURN_KEYS[turn]
+  for colour in ("R", "G", "B"):
+    key ^= EXIT_KEYS[(colour, board.exits_of(colour))]
+  return key
@@ -14,7 +14,8 @@ structures for representing the state of a game.
 
 import sys
 import time
-from collections import defaultdict
+import random
+from array import array
 
 # Game-specific constants:
 
@@ -31,6 +32,46 @@ _FINISHING_HEXES = {
 _ADJACENT_STEPS = [(-1,+0),(+0,-1),(+1,-1),(+1,+0),(+0,+1),(-1,+1)]
 _MAX_TURNS = 256 # per player
 
+# Precomputed move tables (so that validating an action is just a few
+# lookups, see Chexers._is_available):
+
+_RANGE = range(-3, +3+1)
+_HEXES = frozenset((q,r) for q in _RANGE for r in _RANGE if -q-r in _RANGE)
+# for each hex, (adjacent hex, hex beyond it or None) for every direction
+# (in _ADJACENT_STEPS order) where the adjacent hex is on the board
+_STEPS = {qr: [] for qr in _HEXES}
+# the (from, to) hexes of every step, and of every jump with the hex jumped
+_MOVE_PAIRS = set()
+_JUMP_PAIRS = {}
+for _q, _r in _HEXES:
+    for _dq, _dr in _ADJACENT_STEPS:
+        _adj = _q+_dq, _r+_dr
+        _far = _q+2*_dq, _r+2*_dr
+        if _adj in _HEXES:
+            _MOVE_PAIRS.add(((_q,_r), _adj))
+            if _far in _HEXES:
+                _JUMP_PAIRS[((_q,_r), _far)] = _adj
+            else:
+                _far = None
+            _STEPS[_q,_r].append((_adj, _far))
+
+# Zobrist keys (for cheap repeated-state checking): a game state's key is the
+# xor of the keys of its pieces and of the player whose turn it is
+_ZOBRIST_RANDOM = random.Random(0x636865786572)
+_PIECE_KEYS = {(qr, colour): _ZOBRIST_RANDOM.getrandbits(64)
+        for qr in sorted(_HEXES) for colour in "rgb"}
+_TURN_KEYS = [_ZOBRIST_RANDOM.getrandbits(64) for _ in range(3)]
+
+# Action codes (for keeping a compact record of the game): every colour's
+# every possible action, numbered
+_CODED_ACTIONS = [(colour, ("PASS", None)) for colour in "rgb"]
+_CODED_ACTIONS += [(colour, ("EXIT", qr))
+        for qr in sorted(_HEXES) for colour in "rgb"]
+_CODED_ACTIONS += [(colour, (atype, pair))
+        for atype, pairs in [("MOVE", _MOVE_PAIRS), ("JUMP", _JUMP_PAIRS)]
+        for pair in sorted(pairs) for colour in "rgb"]
+_ACTION_CODES = {coded: code for code, coded in enumerate(_CODED_ACTIONS)}
+
 
 # Display-specific constants:
 
@@ -103,19 +144,28 @@ class Chexers:
     """
     def __init__(self, logfilename=None, debugboard=False):
         # initialise game board state:
-        ran = range(-3, +3+1)
-        self.hexes = {(q,r) for q in ran for r in ran if -q-r in ran}
+        self.hexes = set(_HEXES)
         self.board = {qr: ' ' for qr in self.hexes}
+        # and the hexes of each colour's pieces
+        self.pieces = {colour: set() for colour in "rgb"}
+        # and the Zobrist key of the current game state
+        self.key = _TURN_KEYS[0]
         for colour in "rgb":
             for qr in _STARTING_HEXES[colour]:
                 self.board[qr] = colour
+                self.pieces[colour].add(qr)
+                self.key ^= _PIECE_KEYS[qr, colour]
         
         # also keep track of some other state variables for win/draw
-        # detection (score, number of turns, state history)
+        # detection (score, number of turns, state history). The history
+        # counts game states by key, and the (codes of the) actions taken so
+        # far are kept so that the game can be replayed to check a repetition
+        # exactly.
         self.score = {'r': 0, 'g': 0, 'b': 0}
         self.drawmsg = ""
         self.nturns  = 0
-        self.history = defaultdict(int, {self._snap(): 1})
+        self.history = {self.key: 1}
+        self.actions = array('H')
 
         # when we print the board, should we show coordinates?
         self.debugboard = debugboard
@@ -135,25 +185,8 @@ class Chexers:
         Otherwise, apply the action to the game state.
         """
         col = colour[0]
-        available_actions = self._available_actions(col)
-        if action in available_actions:
-            atype, aargs = action
-            if atype == "MOVE":
-                qr_a, qr_b = aargs
-                self.board[qr_a] = ' '
-                self.board[qr_b] = col
-            elif atype == "JUMP":
-                qr_a, qr_b = (q_a, r_a), (q_b, r_b) = aargs
-                qr_c = (q_a+q_b)//2, (r_a+r_b)//2
-                self.board[qr_a] = ' '
-                self.board[qr_b] = col
-                self.board[qr_c] = col
-            elif atype == "EXIT":
-                qr = aargs
-                self.board[qr] = ' '
-                self.score[col] += 1
-            else: # atype == "PASS":
-                pass
+        if self._is_available(col, action):
+            self._apply(col, action)
             self._log_action(colour, action)
             self._turn_detect_draw()
 
@@ -162,30 +195,107 @@ class Chexers:
             self._log("error", result)
             # NOTE: The game instance _could_ potentially be recovered, but:
             self._end_log()
+            available_actions = self._available_actions(col)
             available_actions_list = '\n*   '.join(map(str, available_actions))
             raise IllegalActionException(
                 f"{colour} player's action, {action!r}, is not well-formed or "
                 "not available. See specification and game rules for details, "
                 "or consider currently available actions:\n"
                 f"*   {available_actions_list}")
+    def _apply(self, col, action):
+        """
+        Apply an (available) action of the player with colour col to the
+        game state.
+        """
+        atype, aargs = action
+        if atype == "MOVE":
+            qr_a, qr_b = aargs
+            self.board[qr_a] = ' '
+            self.board[qr_b] = col
+            self.pieces[col].remove(qr_a)
+            self.pieces[col].add(qr_b)
+            self.key ^= _PIECE_KEYS[qr_a, col] ^ _PIECE_KEYS[qr_b, col]
+        elif atype == "JUMP":
+            qr_a, qr_b = aargs
+            qr_c = _JUMP_PAIRS[qr_a, qr_b]
+            self.board[qr_a] = ' '
+            self.board[qr_b] = col
+            self.pieces[col].remove(qr_a)
+            self.pieces[col].add(qr_b)
+            self.key ^= _PIECE_KEYS[qr_a, col] ^ _PIECE_KEYS[qr_b, col]
+            # the piece jumped over is captured (if it isn't ours)
+            jumped = self.board[qr_c]
+            self.pieces[jumped].remove(qr_c)
+            self.board[qr_c] = col
+            self.pieces[col].add(qr_c)
+            self.key ^= _PIECE_KEYS[qr_c, jumped] ^ _PIECE_KEYS[qr_c, col]
+        elif atype == "EXIT":
+            qr = aargs
+            self.board[qr] = ' '
+            self.pieces[col].remove(qr)
+            self.key ^= _PIECE_KEYS[qr, col]
+            self.score[col] += 1
+        else: # atype == "PASS":
+            pass
+        self.actions.append(_ACTION_CODES[col, action])
+    def _is_available(self, colour, action):
+        """
+        True iff action is in _available_actions(colour) (that is, equal to
+        one of those actions), checked directly rather than by building the
+        list.
+        """
+        try:
+            if not (isinstance(action, tuple) and len(action) == 2):
+                return False
+            atype, aargs = action
+            if atype == "PASS":
+                return aargs is None and not self._has_actions(colour)
+            if atype == "EXIT":
+                return (_is_hex(aargs) and self.board[aargs] == colour
+                    and aargs in _FINISHING_HEXES[colour])
+            if atype != "MOVE" and atype != "JUMP":
+                return False
+            if not (isinstance(aargs, tuple) and len(aargs) == 2):
+                return False
+            qr_a, qr_b = aargs
+            if not (_is_hex(qr_a) and _is_hex(qr_b)
+                    and self.board[qr_a] == colour and self.board[qr_b] == ' '):
+                return False
+            if atype == "MOVE":
+                return (qr_a, qr_b) in _MOVE_PAIRS
+            # a jump is only offered where the adjacent hex is occupied
+            qr_c = _JUMP_PAIRS.get((qr_a, qr_b))
+            return qr_c is not None and self.board[qr_c] != ' '
+        except TypeError:
+            # something unhashable in the action, so it can't match
+            return False
+    def _has_actions(self, colour):
+        """
+        True iff a particular player has any action other than passing.
+        """
+        for qr in self.pieces[colour]:
+            if qr in _FINISHING_HEXES[colour]:
+                return True
+            for tqr, jqr in _STEPS[qr]:
+                if self.board[tqr] == ' ' or (jqr is not None
+                        and self.board[jqr] == ' '):
+                    return True
+        return False
     def _available_actions(self, colour):
         """
         A list of currently-available actions for a particular player
-        (assists validation).
+        (for describing them when an action is not allowed).
         """
         available_actions = []
         for qr in self.hexes:
             if self.board[qr] == colour:
                 if qr in _FINISHING_HEXES[colour]:
                     available_actions.append(("EXIT", qr))
-                q, r = qr
-                for dq, dr in _ADJACENT_STEPS:
-                    for i, atype in [(1, "MOVE"), (2, "JUMP")]:
-                        tqr = q+dq*i, r+dr*i
-                        if tqr in self.hexes:
-                            if self.board[tqr] == ' ':
-                                available_actions.append((atype, (qr, tqr)))
-                                break
+                for tqr, jqr in _STEPS[qr]:
+                    if self.board[tqr] == ' ':
+                        available_actions.append(("MOVE", (qr, tqr)))
+                    elif jqr is not None and self.board[jqr] == ' ':
+                        available_actions.append(("JUMP", (qr, jqr)))
         if not available_actions:
             available_actions.append(("PASS", None))
         return available_actions
@@ -194,14 +304,30 @@ class Chexers:
         Register that a turn has passed: Update turn counts and 
         detect repeated game states.
         """
+        self.key ^= _TURN_KEYS[self.nturns % 3]
         self.nturns += 1
+        self.key ^= _TURN_KEYS[self.nturns % 3]
         if self.nturns >= _MAX_TURNS * 3:
             self.drawmsg = "maximum number of turns reached."
         
-        state = self._snap()
-        self.history[state] += 1
-        if self.history[state] >= 4:
+        count = self.history.get(self.key, 0) + 1
+        self.history[self.key] = count
+        # different states could (very rarely) share a key, so make sure
+        if count >= 4 and self._count_occurrences() >= 4:
             self.drawmsg = "game state occurred 4 times."
+    def _count_occurrences(self):
+        """
+        Count the times the current game state has occurred, exactly, by
+        replaying the game from the start.
+        """
+        state = self._snap()
+        replay = Chexers()
+        count = int(replay._snap() == state)
+        for code in self.actions:
+            replay._apply(*_CODED_ACTIONS[code])
+            replay.nturns += 1
+            count += replay._snap() == state
+        return count
     def _snap(self):
         """
         Capture the current board state in a hashable way
@@ -271,5 +397,9 @@ class Chexers:
             self._logfile.close()
             self._logfile = None
 
+def _is_hex(qr):
+    """True iff qr is (equal to) the coordinates of a hex on the board."""
+    return isinstance(qr, tuple) and len(qr) == 2 and qr in _HEXES
+
 class IllegalActionException(Exception):
     """If this action is illegal based on the current board state."""
@@ -0,0 +1,194 @@
+"""
+Headless match runner: plays many games of Chexers between three Player
+classes in one process, with no board display and no delays, and reports one
+compact JSON record per game (one per line).
+
+    python -m referee.runner red green blue -n 100 -t 60 -o results.jsonl
+
+The Player classes are imported once and a fresh instance of each is
+constructed for every game. Players can be rotated between the seats from one
+game to the next with -r.
+
+Unlike the referee, the runner does not measure memory: the interpreter's
+peak usage only ever grows over a run of games, so it says nothing about any
+one game.
+
+The runner can also be used from Python:
+
+    from referee.runner import load_players, run_games
+    for record in run_games(load_players(specs), 100, time_limit=60):
+        ...
+"""
+
+import sys
+import json
+import time
+import argparse
+import importlib
+
+from referee.game import Chexers, IllegalActionException
+from referee.player import ResourceLimitException
+from referee.options import PackageSpecAction
+
+_COLOURS = ['red', 'green', 'blue']
+
+def load_players(specs):
+    """
+    Import Player classes (once each) given (module name, class name) pairs,
+    as parsed by the referee's options.
+    """
+    classes = {}
+    players = []
+    for spec in specs:
+        if spec not in classes:
+            module = importlib.import_module(spec[0])
+            classes[spec] = getattr(module, spec[1])
+        players.append(classes[spec])
+    return players
+
+class _TimedPlayer:
+    """
+    Calls a Player's methods, adding up the CPU time it takes (and, if
+    limited, ending the game once it has taken too long).
+    """
+    def __init__(self, Player, colour, time_limit):
+        self.colour = colour
+        self.limit = time_limit
+        self.clock = 0
+        self.player = self._timed(Player, colour)
+
+    def _timed(self, method, *args):
+        start = time.process_time()
+        result = method(*args)
+        self.clock += time.process_time() - start
+        if self.limit and self.clock > self.limit:
+            raise ResourceLimitException(f"{self.colour} player exceeded "
+                "available time")
+        return result
+
+    def action(self):
+        return self._timed(self.player.action)
+
+    def update(self, colour, action):
+        self._timed(self.player.update, colour, action)
+
+def run_game(players, time_limit=0):
+    """
+    Play one game between three Player classes (red's first).
+
+    Returns the game's record: a dictionary with the winner's colour (None
+    for a draw or an error), the referee's result message, the number of
+    turns played, each colour's exits and CPU time, and an error message if
+    a player made an illegal action, ran out of time or raised an exception.
+    """
+    game = Chexers()
+    timed = []
+    error = None
+    # the colour of the player being called (to blame for any exception)
+    acting = None
+    try:
+        for Player, acting in zip(players, _COLOURS):
+            timed.append(_TimedPlayer(Player, acting, time_limit))
+        turn = 0
+        while not game.over():
+            curr_player = timed[turn % 3]
+            acting = curr_player.colour
+            action = curr_player.action()
+            acting = None
+            game.update(curr_player.colour, action)
+            for player in timed:
+                acting = player.colour
+                player.update(curr_player.colour, action)
+            turn += 1
+    except IllegalActionException:
+        # (not the referee's message, which lists every available action)
+        error = f"illegal action ({curr_player.colour}): {action!r}"
+    except ResourceLimitException as e:
+        error = str(e)
+    except Exception as e:
+        error = f"{acting} player raised {type(e).__name__}: {e}"
+
+    result = game.end() if error is None else None
+    winner = None
+    if result is not None and result.startswith("winner"):
+        winner = max(game.score, key=game.score.get)
+        winner = _COLOURS["rgb".index(winner)]
+    return {
+        "winner": winner,
+        "result": result,
+        "error": error,
+        "turns": game.nturns,
+        "exits": [game.score[colour[0]] for colour in _COLOURS],
+        "time": [round(player.clock, 3) for player in timed],
+    }
+
+def run_games(players, n, time_limit=0, rotate=False):
+    """
+    Play n games between three Player classes, yielding each game's record
+    (see run_game) as it finishes, along with the game's number and the
+    index (into players) of the Player class in each seat.
+    """
+    seats = [0, 1, 2]
+    for i in range(n):
+        record = {"game": i, "seats": list(seats)}
+        record.update(run_game([players[s] for s in seats], time_limit))
+        yield record
+        if rotate:
+            seats = seats[1:] + seats[:1]
+
+def get_options():
+    """Parse and return command-line arguments."""
+    parser = argparse.ArgumentParser(prog="referee.runner",
+        description="plays many games of Chexers between three Player classes "
+            "without displaying them, reporting one JSON record per game.")
+    for dest, colour in [('playerR_loc', 'red'), ('playerG_loc', 'green'),
+            ('playerB_loc', 'blue')]:
+        parser.add_argument(dest, metavar=colour, action=PackageSpecAction,
+            help=f"location of {colour.capitalize()}'s Player class (see "
+                "`python -m referee --help`)")
+    parser.add_argument('-n', '--games', type=int, default=1,
+        help="how many games to play (default: 1)")
+    parser.add_argument('-t', '--time', metavar="time_limit", type=float,
+        default=0, help="limit on CPU time (float, seconds) for each player "
+            "in each game (default: 0, no limit)")
+    parser.add_argument('-r', '--rotate', action="store_true",
+        help="move each Player class to the next seat after every game")
+    parser.add_argument('-o', '--output', metavar="FILE", default=None,
+        help="file to write the records to (default: standard output)")
+    return parser.parse_args()
+
+def main():
+    options = get_options()
+    specs = [options.playerR_loc, options.playerG_loc, options.playerB_loc]
+    players = load_players(specs)
+
+    out = sys.stdout
+    if options.output is not None:
+        out = open(options.output, 'w')
+    wins = [0, 0, 0]
+    draws = errors = 0
+    start = time.time()
+    try:
+        for record in run_games(players, options.games, options.time,
+                options.rotate):
+            print(json.dumps(record, separators=(',', ':')), file=out)
+            if record["error"] is not None:
+                errors += 1
+            elif record["winner"] is None:
+                draws += 1
+            else:
+                wins[record["seats"][_COLOURS.index(record["winner"])]] += 1
+    except KeyboardInterrupt:
+        print(file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.time() - start
+    names = [":".join(spec) for spec in specs]
+    summary = ", ".join(f"{name} {n}" for name, n in zip(names, wins))
+    print(f"* wins: {summary}; draws: {draws}; errors: {errors} "
+        f"({elapsed:.1f}s)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()